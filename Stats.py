@@ -1,42 +1,252 @@
 import disnake
 from disnake.ext import commands
 import aiohttp
+import argparse
+import asyncio
+import bisect
+import csv
+import hashlib
+import heapq
+import json
+import logging
+import math
+import multiprocessing
+import os
 import re
-from typing import Optional
+import sqlite3
+import sys
+import tempfile
+import time
+import zlib
+from aiohttp import web
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = ImageDraw = ImageFont = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+log = logging.getLogger(__name__)
+
+json_loads = orjson.loads if orjson is not None else json.loads
+
+
+# Настройки HTTP-клиента для ruststats.io
+HTTP_POOL_LIMIT = 50
+HTTP_POOL_LIMIT_PER_HOST = 20
+HTTP_KEEPALIVE_TIMEOUT = 30
+HTTP_DNS_CACHE_TTL = 300
+HTTP_TIMEOUT_TOTAL = 15
+HTTP_TIMEOUT_CONNECT = 3
+HTTP_TIMEOUT_READ = 8
+
+# Circuit breaker: ошибок подряд до размыкания и пауза до пробного запроса (секунды)
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30
+
+# Экспорт /check export: игроков в одной порции чтения и записи
+EXPORT_CHUNK_SIZE = 200
+
+# Координатор шардов: путь к Unix-сокету (None — каждый процесс со своим бюджетом и кэшем),
+# таймаут запросов к общему кэшу, предельное ожидание общего токена (дольше — запрос
+# отклоняется как 429) и пауза перед повторным подключением (секунды),
+# предельная длина строки протокола и тела профиля, которым шард делится (байты)
+COORDINATOR_SOCKET = None
+COORDINATOR_TIMEOUT = 0.5
+COORDINATOR_ACQUIRE_TIMEOUT = 10
+COORDINATOR_RETRY = 5
+COORDINATOR_LINE_LIMIT = 4 * 1024 * 1024
+COORDINATOR_MAX_BODY = 1024 * 1024
+
+# Допуск /check account: одновременных команд всего и на гильдию, длина очереди,
+# предельное ожидание в очереди (секунды)
+ADMISSION_GLOBAL_LIMIT = 32
+ADMISSION_GUILD_LIMIT = 4
+ADMISSION_QUEUE_SIZE = 200
+ADMISSION_MAX_WAIT = 10
+
+# Лимит запросов к ruststats.io: запросов в секунду, размер всплеска, повторы после 429,
+# наибольшая пауза, которую может назначить Retry-After (секунды)
+UPSTREAM_RATE = 5.0
+UPSTREAM_BURST = 10
+UPSTREAM_MAX_RETRIES = 1
+UPSTREAM_MAX_RETRY_AFTER = 10
+UPSTREAM_DEFAULT_RETRY_AFTER = 5
+UPSTREAM_RETRY_AFTER_CAP = 300
+
+# Настройки кэша профилей (секунды)
+PROFILE_CACHE_SIZE = 2048
+PROFILE_CACHE_TTL = 300
+PROFILE_CACHE_MAX_TTL = 1800
+PROFILE_CACHE_STALE_TTL = 3600
+
+# SQLite-хранилище последних ответов API (None — отключено)
+PROFILE_STORE_PATH = "ruststats.sqlite3"
+PROFILE_STORE_FLUSH_INTERVAL = 2
+
+# История снимков: первые дни хранятся все снимки, дальше — последний за сутки,
+# старше SNAPSHOT_RETENTION_DAYS удаляются (None — хранить всегда); период прореживания (секунды)
+SNAPSHOT_KEEP_ALL_DAYS = 14
+SNAPSHOT_RETENTION_DAYS = 365
+SNAPSHOT_THIN_INTERVAL = 6 * 3600
+
+# Размер общего кэша готовых embed (страниц)
+EMBED_CACHE_SIZE = 4096
+
+# Массовая проверка: максимум игроков и одновременных запросов
+BULK_MAX_PLAYERS = 10
+BULK_CONCURRENCY = 4
+
+# Таблица лидеров: игроков на странице, время жизни панели (секунды)
+LEADERBOARD_PAGE_SIZE = 10
+LEADERBOARD_VIEW_TIMEOUT = 300
+
+# Сравнение игроков: время жизни панели (секунды), период пересборки отсортированных столбцов
+COMPARE_VIEW_TIMEOUT = 300
+PERCENTILE_REBUILD_INTERVAL = 30
+
+# Отслеживание игроков: границы интервала опроса (секунды), бюджет опросов в секунду,
+# размер пачки, пауза планировщика без дел, лимит игроков на гильдию
+WATCH_MIN_INTERVAL = 300
+WATCH_MAX_INTERVAL = 6 * 3600
+WATCH_BACKOFF = 1.5
+WATCH_BUDGET = 0.5
+WATCH_BATCH_SIZE = 5
+WATCH_IDLE_SLEEP = 30
+WATCH_MAX_PER_GUILD = 100
+# Поля, изменение которых (как и флага бана) вызывает оповещение
+WATCH_KEY_FIELDS = ("overview.time_played", "pvp_stats.kills", "pvp_stats.deaths")
+# Очередь лимитера для фонового опроса: id гильдий положительны, а 0 занят
+# запросами без гильдии (личные сообщения, фоновое обновление кэша)
+WATCH_LIMITER_KEY = -1
+
+# Лимит живых StatsView и префикс custom_id их кнопок
+VIEW_REGISTRY_SIZE = 500
+VIEW_CUSTOM_ID_PREFIX = "ruststats"
+
+# Размер кэша vanity-имя -> steamid64
+VANITY_CACHE_SIZE = 8192
+
+# Автодополнение: игроков в индексе, подсказок в ответе (лимит Discord), просматриваемых ключей
+AUTOCOMPLETE_INDEX_SIZE = 10000
+AUTOCOMPLETE_CHOICES = 25
+AUTOCOMPLETE_SCAN_LIMIT = 200
+
+# Эндпоинт метрик Prometheus (None — выключен) и границы гистограмм задержек (секунды)
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = None
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0)
+
+# PNG-карточки: каталог кэша (None — выключены), процессов рендера, локаль, лимит файлов, шрифты
+CARD_CACHE_DIR = "card_cache"
+CARD_WORKERS = 2
+CARD_LOCALE = "ru"
+CARD_CACHE_MAX_FILES = 20000
+CARD_FONT = "DejaVuSans.ttf"
+CARD_FONT_BOLD = "DejaVuSans-Bold.ttf"
+# Способ запуска процессов рендера. fork при уже работающих потоках (хранилище, executor,
+# резолвер aiohttp) может унаследовать захваченную блокировку и зависнуть; при forkserver
+# и spawn скрипт запуска бота должен вызывать bot.run() под if __name__ == "__main__"
+CARD_START_METHOD = "forkserver"
+
+# Размер memo-кэша переводов translate_time
+TRANSLATE_CACHE_SIZE = 4096
+
+
+TIME_TRANSLATIONS = {
+    'hours': 'часов',
+    'hour': 'час',
+    'minutes': 'минут',
+    'minute': 'минута',
+    'seconds': 'секунд',
+    'second': 'секунда',
+    'days': 'дней',
+    'day': 'день',
+    'weeks': 'недель',
+    'week': 'неделя',
+    'months': 'месяцев',
+    'month': 'месяц',
+    'years': 'лет',
+    'year': 'год',
+    'miles': 'миль',
+    'mile': 'миля',
+    'kilometers': 'км',
+    'kilometer': 'км',
+    'and': 'и',
+    'ago': 'назад',
+}
+
+# Одна альтернация на все слова: длинные варианты первыми, чтобы "hours" не съел "hour"
+_TIME_PATTERN = re.compile(
+    r'\b(?:' + '|'.join(sorted(map(re.escape, TIME_TRANSLATIONS), key=len, reverse=True)) + r')\b',
+    re.IGNORECASE
+)
+
+def _translate_match(match: re.Match) -> str:
+    return TIME_TRANSLATIONS[match.group(0).lower()]
+
+
+@lru_cache(maxsize=TRANSLATE_CACHE_SIZE)
+def _translate_cached(text: str) -> str:
+    return _TIME_PATTERN.sub(_translate_match, text)
 
 
 def translate_time(text: str) -> str:
     if not text or not isinstance(text, str):
         return text
+    return _translate_cached(text)
+
+
+_DURATION_PATTERN = re.compile(
+    r'(\d+(?:\.\d+)?)\s*(second|minute|hour|day|week|month|year)s?\b',
+    re.IGNORECASE
+)
+
+_DURATION_SECONDS = {
+    'second': 1,
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400,
+    'week': 604800,
+    'month': 2592000,
+    'year': 31536000,
+}
+
+
+def parse_duration(text) -> Optional[float]:
+    """Разбор строки вида "2 hours and 5 minutes" в секунды"""
+    if not text or not isinstance(text, str):
+        return None
     
-    translations = {
-        'hours': 'часов',
-        'hour': 'час',
-        'minutes': 'минут',
-        'minute': 'минута',
-        'seconds': 'секунд',
-        'second': 'секунда',
-        'days': 'дней',
-        'day': 'день',
-        'weeks': 'недель',
-        'week': 'неделя',
-        'months': 'месяцев',
-        'month': 'месяц',
-        'years': 'лет',
-        'year': 'год',
-        'miles': 'миль',
-        'mile': 'миля',
-        'kilometers': 'км',
-        'kilometer': 'км',
-        'and': 'и',
-        'ago': 'назад',
-    }
-    
-    result = text
-    for eng, rus in translations.items():
-        result = re.sub(rf'\b{eng}\b', rus, result, flags=re.IGNORECASE)
-    
-    return result
+    matches = _DURATION_PATTERN.findall(text)
+    if not matches:
+        return None
+    return sum(float(amount) * _DURATION_SECONDS[unit.lower()] for amount, unit in matches)
 
 
 def format_value(value) -> str:
@@ -48,19 +258,822 @@ def format_value(value) -> str:
     return str(value)
 
 
-def stat_line(emoji: str, label: str, value) -> str:
-    """Форматирование строки статистики: `emoji` label: **value**"""
-    return f"`{emoji}` {label}: **{format_value(value)}**"
+def block(name: str, *paths: str, template: str = "{}", labels: tuple = None, inline: bool = True) -> dict:
+    """Поле схемы: значения по путям в блоке кода, подставленные в template
+    
+    labels — подписи отдельных значений, если путей несколько (для страницы изменений).
+    """
+    return {
+        "kind": "block", "name": name, "paths": paths, "template": template,
+        "labels": labels or (name,) * len(paths), "inline": inline,
+    }
+
+
+def lines(name: str, *rows: tuple, inline: bool = True) -> dict:
+    """Поле схемы: строки "`эмодзи` подпись: **значение**", заданные как (эмодзи, подпись, путь[, суффикс])"""
+    return {"kind": "lines", "name": name, "rows": rows, "inline": inline}
+
+
+# Схема страниц StatsView. Путь "раздел.ключ" указывает на значение в ответе API.
+PAGES = (
+    {
+        "key": "overview", "label": "Обзор", "emoji": "📊", "row": 0,
+        "title": "📊 Обзор профиля",
+        "fields": (
+            block("⏱️ Время в игре", "overview.time_played"),
+            block("📅 Аккаунт создан", "overview.account_created"),
+            block("🎮 За 2 недели", "overview.played_last_2weeks"),
+            block("⚔️ K/D Ratio", "pvp_stats.kdr"),
+            block(
+                "💀 Убийства / Смерти", "pvp_stats.kills", "pvp_stats.deaths",
+                template="{} / {}", labels=("💀 Убийства", "💀 Смерти")
+            ),
+            block("🎯 Точность", "pvp_stats.bullets_hit_percent"),
+            block(
+                "🎯 Хедшоты", "pvp_stats.headshots", "pvp_stats.headshot_percent",
+                template="{} ({})", labels=("🎯 Хедшоты", "🎯 % хедшотов")
+            ),
+            block(
+                "🔫 Выстрелов / Попаданий", "pvp_stats.bullets_fired", "pvp_stats.bullets_hit",
+                template="{} / {}", labels=("🔫 Выстрелов", "🔫 Попаданий")
+            ),
+            block("🏆 Достижения", "overview.achievement_count"),
+        ),
+    },
+    {
+        "key": "kills", "label": "Убийства", "emoji": "💀", "row": 0,
+        "title": "💀 Статистика убийств",
+        "fields": (
+            lines(
+                "🎯 Убийства существ",
+                ("🧑", "Игроки", "kills.players"),
+                ("🔬", "Ученые", "kills.scientists"),
+                ("🐻", "Медведи", "kills.bears"),
+                ("🐗", "Кабаны", "kills.boars"),
+                ("🐺", "Волки", "kills.wolves"),
+                ("🦌", "Олени", "kills.deer"),
+                ("🐴", "Лошади", "kills.horses"),
+                ("🐔", "Куры", "kills.chickens"),
+            ),
+            lines(
+                "💥 Другое",
+                ("🚀", "MLRS убийств", "other.mlrs_kills"),
+                ("🦈", "Из гарпуна", "other.shark_speargun_kills"),
+                ("🛢️", "Бочек", "other.barrels_destroyed"),
+                ("🚗", "Машин", "other.cars_shredded"),
+            ),
+            lines(
+                "⚔️ Ближний бой",
+                ("🗡️", "Ударов", "melee.strikes"),
+                ("🪃", "Бросков", "melee.throws"),
+                inline=False,
+            ),
+        ),
+    },
+    {
+        "key": "combat", "label": "Бой", "emoji": "🔫", "row": 0,
+        "title": "🔫 Боевая статистика",
+        "fields": (
+            lines(
+                "🔫 Попадания пулями",
+                ("🧑", "В игроков", "bullets_hit.players"),
+                ("🏠", "В строения", "bullets_hit.buildings"),
+                ("💀", "В трупы", "bullets_hit.dead_players"),
+                ("🐻", "В медведей", "bullets_hit.bears"),
+                ("🐗", "В кабанов", "bullets_hit.boars"),
+                ("🐺", "В волков", "bullets_hit.wolves"),
+                ("🐴", "В лошадей", "bullets_hit.horses"),
+            ),
+            lines(
+                "🏹 Лук",
+                ("🎯", "Точность", "bow_hits.rate"),
+                ("🧑", "В игроков", "bow_hits.players"),
+                ("🏠", "В строения", "bow_hits.buildings"),
+                ("🐻", "В медведей", "bow_hits.bears"),
+                ("🦌", "В оленей", "bow_hits.deer"),
+                ("🏹", "Выстрелов", "bow_hits.shots_fired"),
+            ),
+            lines(
+                "💥 Дробовик",
+                ("🧑", "В игроков", "shotgun_hits.players"),
+                ("🏠", "В строения", "shotgun_hits.buildings"),
+                ("🔫", "Выстрелов", "shotgun_hits.shots_fired"),
+            ),
+            block("🚀 Ракеты выпущено", "other.rockets_fired", inline=False),
+        ),
+    },
+    {
+        "key": "deaths", "label": "Смерти", "emoji": "☠️", "row": 1,
+        "title": "☠️ Смерти и ранения",
+        "fields": (
+            lines(
+                "💀 Смерти",
+                ("💀", "Всего смертей", "deaths.total"),
+                ("🪂", "От падения", "deaths.fall"),
+                ("🔫", "Суицид", "deaths.suicide"),
+                ("💥", "Самоповреждение", "deaths.self_inflicted"),
+            ),
+            lines(
+                "🩹 Ранения",
+                ("🩸", "Ранен", "wounds.wounded"),
+                ("💊", "Исцелён", "wounds.healed"),
+                ("🤝", "Помог другим", "wounds.assisted"),
+            ),
+        ),
+    },
+    {
+        "key": "gathered", "label": "Ресурсы", "emoji": "⛏️", "row": 1,
+        "title": "⛏️ Добыча ресурсов",
+        "fields": (
+            lines(
+                "📦 Ресурсы",
+                ("🪵", "Дерево", "gathered.wood"),
+                ("🪨", "Камень", "gathered.stone"),
+                ("⛏️", "Металл", "gathered.metal_ore"),
+                ("🔩", "Скрап", "gathered.scrap"),
+                ("🧵", "Ткань", "gathered.cloth"),
+                ("🛢️", "НК топливо", "gathered.low_grade_fuel"),
+                ("🐄", "Кожа", "gathered.leather"),
+            ),
+            lines(
+                "🔨 Добыча",
+                ("⛏️", "Ударов по руде", "gathered.ore_hits"),
+                ("🪓", "Ударов по дереву", "gathered.tree_hits"),
+            ),
+            lines(
+                "🍽️ Потребление",
+                ("💧", "Воды выпито", "consumed.water"),
+                ("🍖", "Калорий съедено", "consumed.calories"),
+                inline=False,
+            ),
+        ),
+    },
+    {
+        "key": "building", "label": "Стройка", "emoji": "🏗️", "row": 1,
+        "title": "🏗️ Строительство и электричество",
+        "fields": (
+            lines(
+                "🏠 Строительство",
+                ("🧱", "Блоков установлено", "building_blocks.placed"),
+                ("⬆️", "Блоков улучшено", "building_blocks.upgraded"),
+            ),
+            lines(
+                "⚡ Электричество",
+                ("🔌", "Проводов", "other.wires_connected"),
+                ("🔧", "Труб", "other.pipes_connected"),
+                ("🔔", "Сигнализаций", "other.tincanalarms_wired"),
+            ),
+            block("📜 Чертежей изучено", "other.bps_learned", inline=False),
+        ),
+    },
+    {
+        "key": "exposure", "label": "Среда", "emoji": "🌡️", "row": 2,
+        "title": "🌡️ Окружающая среда",
+        "fields": (
+            lines(
+                "🌡️ Температура",
+                ("❄️", "На холоде", "exposure.cold"),
+                ("🔥", "На жаре", "exposure.heat"),
+                ("😌", "В комфорте", "exposure.comfort"),
+                ("☢️", "В радиации", "exposure.radiation"),
+            ),
+            lines(
+                "🚗 Транспорт",
+                ("🐴", "На лошади", "horse_distance_ridden.kilometers", " км"),
+                ("🏇", "Раз садился", "horse_distance_ridden.mounted_times"),
+                ("🚁", "Посадок на вертолётную", "other.helipad_landings"),
+                ("🛶", "На каяке", "other.kayak_distance_travelled"),
+            ),
+        ),
+    },
+    {
+        "key": "fishing", "label": "Рыбалка", "emoji": "🎣", "row": 2,
+        "title": "🎣 Рыбалка",
+        "fields": (
+            lines(
+                "🐠 Рыба (1)",
+                ("🐟", "Лосось", "fishing.caught_salmon"),
+                ("🐟", "Анчоус", "fishing.caught_anchovy"),
+                ("🐟", "Сом", "fishing.caught_catfish"),
+                ("🐟", "Сельдь", "fishing.caught_herring"),
+                ("🐟", "Сардина", "fishing.caught_sardine"),
+            ),
+            lines(
+                "🐠 Рыба (2)",
+                ("🦈", "Маленькая акула", "fishing.caught_small_shark"),
+                ("🐟", "Форель", "fishing.caught_small_trout"),
+                ("🐟", "Жёлтый окунь", "fishing.caught_yellow_perch"),
+                ("🐟", "Оранжевый ёрш", "fishing.caught_orange_roughy"),
+            ),
+        ),
+    },
+    {
+        "key": "other", "label": "Другое", "emoji": "📋", "row": 2,
+        "title": "📋 Другое",
+        "fields": (
+            lines(
+                "📂 Открытий меню",
+                ("🎒", "Инвентарь", "menus_opened.inventory"),
+                ("🗺️", "Карта", "menus_opened.map"),
+                ("🔨", "Крафт", "menus_opened.crafting"),
+                ("🏠", "Шкаф", "menus_opened.cupboard"),
+            ),
+            lines(
+                "🎲 Разное",
+                ("🎤", "Голосовой чат", "other.voicechat_time"),
+                ("👋", "Помахал игрокам", "other.waved_at_players"),
+                ("📦", "Выброшено", "other.items_dropped"),
+                ("🔍", "Осмотрено", "other.items_inspected"),
+                ("📋", "Миссий", "other.missions_completed"),
+                ("🐝", "Атак пчёл", "other.bee_attacks_count"),
+            ),
+            lines(
+                "🎸 Музыка",
+                ("🎵", "Нот сыграно", "instruments.notes_played"),
+                ("🎹", "Бинды нот", "instruments.note_binds"),
+                inline=False,
+            ),
+        ),
+    },
+)
+
+
+# Все пути, которые используют страницы, в порядке схемы
+STAT_FIELDS = tuple(dict.fromkeys(
+    path
+    for page in PAGES
+    for field in page["fields"]
+    for path in (field["paths"] if field["kind"] == "block" else [row[2] for row in field["rows"]])
+))
+FIELD_INDEX = {path: index for index, path in enumerate(STAT_FIELDS)}
+
+
+def _field_labels():
+    """Подпись и страница каждого пути схемы"""
+    labels, pages = {}, {}
+    for page in PAGES:
+        for field in page["fields"]:
+            if field["kind"] == "block":
+                named = zip(field["paths"], field["labels"])
+            else:
+                named = ((row[2], f"{row[0]} {row[1]}") for row in field["rows"])
+            for path, label in named:
+                labels.setdefault(path, label)
+                pages.setdefault(path, page["key"])
+    return labels, pages
+
+
+FIELD_LABELS, FIELD_PAGE = _field_labels()
+
+# Поля снимков истории: всё числовое, кроме значений, меняющихся сами по себе со временем
+SNAPSHOT_EXCLUDE = {"overview.account_created"}
+SNAPSHOT_FIELDS = tuple(path for path in STAT_FIELDS if path not in SNAPSHOT_EXCLUDE)
+SNAPSHOT_INDEXES = tuple(FIELD_INDEX[path] for path in SNAPSHOT_FIELDS)
+# Снимки сравниваются только при одинаковом наборе полей
+SNAPSHOT_LAYOUT = zlib.crc32("\n".join(SNAPSHOT_FIELDS).encode())
+
+_NUMBER_PATTERN = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+def normalize_value(value):
+    """Привести значение к int/float, если строка — это число без потерь при обратном выводе"""
+    if isinstance(value, str):
+        if _NUMBER_PATTERN.fullmatch(value):
+            number = float(value) if "." in value else int(value)
+            if str(number) == value:
+                return number
+        return sys.intern(value)
+    return value
+
+
+STEAMID64_BASE = 76561197960265728
+
+_STEAMID64_PATTERN = re.compile(r'7656119\d{10}')
+_STEAM2_PATTERN = re.compile(r'STEAM_[0-5]:([01]):(\d+)', re.IGNORECASE)
+_STEAM3_PATTERN = re.compile(r'\[?U:1:(\d+)\]?', re.IGNORECASE)
+_PROFILE_URL_PATTERN = re.compile(
+    r'(?:https?://)?(?:www\.)?steamcommunity\.com/(profiles|id)/([^/?#\s]+)', re.IGNORECASE
+)
+
+
+def parse_steam_input(text: str) -> Tuple[str, str]:
+    """Разобрать ввод пользователя без обращения к сети
+    
+    Возвращает ("steamid", steamid64) для SteamID64, SteamID2, SteamID3 и
+    ссылок /profiles/, иначе ("vanity", имя в нижнем регистре) для ссылок /id/
+    и просто имён.
+    """
+    text = text.strip()
+    
+    url = _PROFILE_URL_PATTERN.match(text)
+    if url:
+        kind, value = url.groups()
+        if kind.lower() == "profiles" and _STEAMID64_PATTERN.fullmatch(value):
+            return "steamid", value
+        return "vanity", value.lower()
+    
+    if _STEAMID64_PATTERN.fullmatch(text):
+        return "steamid", text
+    
+    steam2 = _STEAM2_PATTERN.fullmatch(text)
+    if steam2:
+        return "steamid", str(STEAMID64_BASE + int(steam2.group(2)) * 2 + int(steam2.group(1)))
+    
+    steam3 = _STEAM3_PATTERN.fullmatch(text)
+    if steam3:
+        return "steamid", str(STEAMID64_BASE + int(steam3.group(1)))
+    
+    return "vanity", text.lower()
+
+
+class SteamIdResolver:
+    """Определение steamid64 по вводу: локальный разбор и кэш vanity-имён
+    
+    Имена запоминаются из ответов API, поэтому повторные запросы по имени или
+    ссылке /id/ сразу получают steamid64 и общий с ним ключ кэша.
+    """
+    
+    def __init__(self, max_size: int = VANITY_CACHE_SIZE):
+        self.max_size = max_size
+        self._vanity: "OrderedDict[str, str]" = OrderedDict()
+        
+        self.hits = 0
+        self.misses = 0
+    
+    def __len__(self) -> int:
+        return len(self._vanity)
+    
+    def resolve(self, query: str) -> Tuple[Optional[str], str]:
+        """(steamid64 или None, нормализованный ввод)"""
+        kind, value = parse_steam_input(query)
+        if kind == "steamid":
+            return value, value
+        
+        steamid = self._vanity.get(value)
+        if steamid is None:
+            self.misses += 1
+            return None, value
+        self.hits += 1
+        self._vanity.move_to_end(value)
+        return steamid, value
+    
+    def learn(self, name: str, steamid: str):
+        """Запомнить vanity-имя (в нижнем регистре) профиля"""
+        self._vanity[name] = steamid
+        self._vanity.move_to_end(name)
+        if len(self._vanity) > self.max_size:
+            self._vanity.popitem(last=False)
+    
+    def stats(self) -> dict:
+        return {
+            "size": len(self._vanity),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def to_number(value) -> float:
+    """Числовое значение статистики: числа, "23.8%", "1,234", длительности (в часах); иначе NaN"""
+    if isinstance(value, bool) or value is None:
+        return math.nan
+    if isinstance(value, (int, float)):
+        number = float(value)
+        return number if math.isfinite(number) else math.nan
+    
+    text = value.replace(",", "").strip()
+    try:
+        number = float(text.rstrip("%"))
+    except ValueError:
+        pass
+    else:
+        # float() понимает "inf" и "nan" — для статистики это не числа
+        return number if math.isfinite(number) else math.nan
+    seconds = parse_duration(text)
+    if seconds is None:
+        return math.nan
+    return seconds / 3600
+
+
+def snapshot_values(record: "ProfileRecord") -> array:
+    """Числовая статистика профиля (float64 в порядке SNAPSHOT_FIELDS)"""
+    values = record.values
+    return array("d", [to_number(values[index]) for index in SNAPSHOT_INDEXES])
+
+
+def pack_snapshot(record: "ProfileRecord") -> bytes:
+    """Сжатый снимок числовой статистики"""
+    return zlib.compress(snapshot_values(record).tobytes())
+
+
+def unpack_snapshot(blob: bytes) -> array:
+    values = array("d")
+    values.frombytes(zlib.decompress(blob))
+    return values
+
+
+def compute_deltas(old: array, new: array) -> list:
+    """Разница двух снимков одним векторным проходом"""
+    if np is not None:
+        return (np.frombuffer(new, dtype=np.float64) - np.frombuffer(old, dtype=np.float64)).tolist()
+    return [b - a for a, b in zip(old, new)]
+
+
+def format_number(value: float) -> str:
+    if not math.isfinite(value):
+        return "—"
+    if value == int(value):
+        return f"{int(value):,}".replace(",", " ")
+    return f"{value:,.2f}".replace(",", " ")
+
+
+class ProfileRecord:
+    """Компактный профиль: только поля, которые показывают страницы
+    
+    Статистика лежит в кортеже values в порядке STAT_FIELDS, числа приведены
+    к int/float, остальное ответа API не хранится.
+    """
+    
+    __slots__ = (
+        "steamid", "personaname", "avatar_url", "avatar_full_url",
+        "is_private", "is_banned", "since_last_update", "vanity", "version", "values",
+    )
+    
+    def __init__(
+        self,
+        steamid: str,
+        personaname: str,
+        avatar_url: str,
+        avatar_full_url: str,
+        is_private: bool,
+        is_banned: bool,
+        since_last_update: str,
+        vanity: Optional[str],
+        version: int,
+        values: tuple,
+    ):
+        self.steamid = steamid
+        self.personaname = personaname
+        self.avatar_url = avatar_url
+        self.avatar_full_url = avatar_full_url
+        self.is_private = is_private
+        self.is_banned = is_banned
+        self.since_last_update = since_last_update
+        self.vanity = vanity
+        self.version = version
+        self.values = values
+    
+    @classmethod
+    def from_payload(cls, payload: dict, version: int = 0) -> "ProfileRecord":
+        """Разобрать ответ get_profile"""
+        sections: dict = {}
+        values = []
+        for path in STAT_FIELDS:
+            section, key = path.split(".", 1)
+            if section not in sections:
+                sections[section] = payload.get(section) or {}
+            values.append(normalize_value(sections[section].get(key)))
+        
+        steamid = payload.get("steamid")
+        kind, vanity = parse_steam_input(payload.get("profileurl") or "")
+        return cls(
+            steamid=str(steamid) if steamid is not None else None,
+            personaname=payload.get("personaname", "Unknown"),
+            avatar_url=payload.get("avatar_url", ""),
+            avatar_full_url=payload.get("avatar_full_url", ""),
+            is_private=bool(payload.get("is_private", False)),
+            is_banned=bool(payload.get("is_banned", False)),
+            since_last_update=normalize_value(payload.get("since_last_update", "")),
+            vanity=sys.intern(vanity) if kind == "vanity" and vanity else None,
+            version=version,
+            values=tuple(values),
+        )
+    
+    def get(self, path: str):
+        """Значение по пути "раздел.ключ" """
+        return self.values[FIELD_INDEX[path]]
+
+
+def parse_profile(body: bytes) -> Optional[ProfileRecord]:
+    """Разобрать тело ответа get_profile; версия записи — CRC32 тела"""
+    payload = json_loads(body)
+    if not payload:
+        return None
+    return ProfileRecord.from_payload(payload, version=zlib.crc32(body))
+
+
+def _compile_field(spec: dict):
+    """Скомпилировать поле схемы в (имя, inline, функция значения)"""
+    if spec["kind"] == "block":
+        indexes = tuple(FIELD_INDEX[path] for path in spec["paths"])
+        template = f"```{spec['template']}```"
+        
+        def render(record: ProfileRecord) -> str:
+            values = record.values
+            return template.format(*[format_value(values[index]) for index in indexes])
+    else:
+        rows = tuple(
+            (f"`{row[0]}` {row[1]}: **", FIELD_INDEX[row[2]], (row[3] if len(row) > 3 else "") + "**")
+            for row in spec["rows"]
+        )
+        
+        def render(record: ProfileRecord) -> str:
+            values = record.values
+            return "\n".join([
+                prefix + format_value(values[index]) + suffix
+                for prefix, index, suffix in rows
+            ])
+    return spec["name"], spec["inline"], render
+
+
+COMPILED_PAGES = {
+    page["key"]: (page["title"], tuple(_compile_field(field) for field in page["fields"]))
+    for page in PAGES
+}
+
+
+def render_base_embed(record: ProfileRecord) -> disnake.Embed:
+    """Базовый embed с информацией о профиле"""
+    embed = disnake.Embed(color=0xCD412B)
+    embed.set_author(
+        name=record.personaname,
+        icon_url=record.avatar_url,
+        url=f"https://steamcommunity.com/profiles/{record.steamid or ''}"
+    )
+    embed.set_thumbnail(url=record.avatar_full_url)
+    
+    if record.is_private:
+        embed.description = "🔒 **Профиль приватный** — данные могут быть устаревшими"
+    
+    # Статус в footer
+    status = []
+    if record.is_banned:
+        status.append("🔨 ЗАБАНЕН")
+    if record.is_private:
+        status.append("🔒 Приватный")
+    else:
+        status.append("🔓 Открытый")
+    
+    since_update = format_value(record.since_last_update)
+    
+    embed.set_footer(
+        text=f"{' | '.join(status)} • SteamID: {record.steamid or 'N/A'} • Обновлено: {since_update} назад"
+    )
+    return embed
+
+
+def render_page(record: ProfileRecord, page: str) -> disnake.Embed:
+    """Собрать embed страницы по скомпилированной схеме"""
+    title, fields = COMPILED_PAGES.get(page, COMPILED_PAGES["overview"])
+    embed = render_base_embed(record)
+    embed.title = title
+    for name, inline, render in fields:
+        embed.add_field(name=name, value=render(record), inline=inline)
+    return embed
+
+
+# Версия макета карточки: входит в ключ кэша, смена макета не отдаёт старые файлы
+CARD_LAYOUT = 1
+CARD_WIDTH = 960
+CARD_COLUMNS = 3
+CARD_COLORS = {
+    "background": (30, 31, 34),
+    "panel": (43, 45, 49),
+    "accent": (205, 65, 43),
+    "title": (242, 243, 245),
+    "text": (219, 222, 225),
+    "muted": (148, 155, 164),
+}
+
+_CARD_MARKUP = re.compile(r'```|\*\*|`|[\u2300-\u23FF\u2600-\u27BF\u2B00-\u2BFF\uFE0F\u200D\U00010000-\U0010FFFF]')
+
+
+def card_content(record: ProfileRecord, page: str) -> tuple:
+    """Текст карточки страницы: (заголовок, игрок, подпись, [(имя поля, строки, inline)])
+    
+    Собирается из той же схемы, что и embed, без разметки Discord и цветных
+    эмодзи, которых нет в шрифте.
+    """
+    title, fields = COMPILED_PAGES.get(page, COMPILED_PAGES["overview"])
+    clean = lambda text: _CARD_MARKUP.sub("", text).strip()
+    status = ["ЗАБАНЕН"] if record.is_banned else []
+    status.append("Приватный" if record.is_private else "Открытый")
+    footer = f"{' | '.join(status)} • SteamID: {record.steamid or 'N/A'} • Обновлено: {format_value(record.since_last_update)} назад"
+    return (
+        clean(title),
+        record.personaname,
+        footer,
+        [(clean(name), [clean(line) for line in render(record).split("\n")], inline) for name, inline, render in fields],
+    )
+
+
+@lru_cache(maxsize=16)
+def _card_font(bold: bool, size: int):
+    try:
+        return ImageFont.truetype(CARD_FONT_BOLD if bold else CARD_FONT, size)
+    except OSError:
+        return ImageFont.load_default(size)
+
+
+def draw_card(path: str, content: tuple) -> str:
+    """Нарисовать карточку и атомарно записать PNG (выполняется в процессе пула)"""
+    title, player, footer, fields = content
+    colors = CARD_COLORS
+    title_font, name_font, text_font, small_font = (
+        _card_font(True, 30), _card_font(True, 18), _card_font(False, 18), _card_font(False, 15)
+    )
+    margin, gap, line_height = 24, 12, 26
+    column_width = (CARD_WIDTH - 2 * margin - (CARD_COLUMNS - 1) * gap) // CARD_COLUMNS
+    
+    # Раскладка: inline-поля идут по CARD_COLUMNS в ряд, остальные на всю ширину
+    layout, row, y = [], [], 96
+    for field in fields + [None]:
+        if field is not None and field[2] and len(row) < CARD_COLUMNS:
+            row.append(field)
+            continue
+        if row:
+            height = 44 + line_height * max(len(lines) for _, lines, _ in row)
+            for column, item in enumerate(row):
+                layout.append((margin + column * (column_width + gap), y, column_width, height, item))
+            y += height + gap
+            row = []
+        if field is None:
+            break
+        if field[2]:
+            row.append(field)
+        else:
+            height = 44 + line_height * len(field[1])
+            layout.append((margin, y, CARD_WIDTH - 2 * margin, height, field))
+            y += height + gap
+    height = y + 36
+    
+    image = Image.new("RGB", (CARD_WIDTH, height), colors["background"])
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, CARD_WIDTH, 6), fill=colors["accent"])
+    draw.text((margin, 22), title, font=title_font, fill=colors["title"])
+    draw.text((CARD_WIDTH - margin, 30), player, font=name_font, fill=colors["muted"], anchor="ra")
+    
+    for x, y, width, box_height, (name, lines, _) in layout:
+        draw.rounded_rectangle((x, y, x + width, y + box_height), radius=8, fill=colors["panel"])
+        draw.text((x + 14, y + 12), name, font=name_font, fill=colors["accent"])
+        for number, line in enumerate(lines):
+            draw.text((x + 14, y + 42 + number * line_height), line, font=text_font, fill=colors["text"])
+    draw.text((margin, height - 28), footer, font=small_font, fill=colors["muted"])
+    
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = f"{path}.{os.getpid()}.tmp"
+    image.save(temp, format="PNG")
+    os.replace(temp, path)
+    return path
+
+
+def make_custom_id(steamid: str, page: str, author_id: int, card: bool = False) -> str:
+    """custom_id кнопки: по нему view восстанавливается после перезапуска"""
+    custom_id = f"{VIEW_CUSTOM_ID_PREFIX}:{steamid}:{page}:{author_id}"
+    return f"{custom_id}:card" if card else custom_id
+
+
+def parse_custom_id(custom_id: str) -> Optional[Tuple[str, str, int, bool]]:
+    """Разобрать custom_id кнопки StatsView в (steamid, страница, автор, карточка)"""
+    parts = custom_id.split(":")
+    if len(parts) not in (4, 5) or parts[0] != VIEW_CUSTOM_ID_PREFIX or not parts[3].isdigit():
+        return None
+    if len(parts) == 5 and parts[4] != "card":
+        return None
+    return parts[1], parts[2], int(parts[3]), len(parts) == 5
+
+
+# Страница изменений между снимками истории (не входит в PAGES: строится из снимков)
+DELTA_PAGE = {"key": "delta", "label": "Изменения", "emoji": "📈", "row": 3, "title": "📈 Изменения"}
+SNAPSHOT_SELECT_PAGE = "since"
+
+
+def render_delta_embed(record: ProfileRecord, latest: tuple, earlier: tuple) -> disnake.Embed:
+    """Embed изменений статистики между двумя снимками (время, снимок)"""
+    embed = render_base_embed(record)
+    embed.title = DELTA_PAGE["title"]
+    embed.description = f"Сравнение <t:{int(earlier[0])}:f> → <t:{int(latest[0])}:f>"
+    
+    new = unpack_snapshot(latest[1])
+    deltas = compute_deltas(unpack_snapshot(earlier[1]), new)
+    
+    changes: dict = {}
+    for index, delta in enumerate(deltas):
+        # delta == delta отсекает NaN (значения не было в одном из снимков)
+        if delta and delta == delta:
+            path = SNAPSHOT_FIELDS[index]
+            sign = "+" if delta > 0 else ""
+            changes.setdefault(FIELD_PAGE[path], []).append(
+                f"{FIELD_LABELS[path]}: **{format_number(new[index])}** ({sign}{format_number(delta)})"
+            )
+    
+    if not changes:
+        embed.description += "\n\nИзменений нет"
+    for page, lines in changes.items():
+        value = ""
+        for line in lines:
+            if len(value) + len(line) + 1 > 1024:
+                break
+            value += line + "\n"
+        embed.add_field(name=COMPILED_PAGES[page][0], value=value.rstrip(), inline=False)
+    return embed
+
+
+def compare_cell(value: float, rank: float, better: bool) -> str:
+    """Значение игрока в сравнении: число (жирное у лидера) и перцентиль"""
+    if value != value:
+        return "—"
+    number = f"**{format_number(value)}**" if better else format_number(value)
+    return f"{number} `{rank:.0f}%`" if rank == rank else number
+
+
+def render_compare_embed(first: ProfileRecord, second: ProfileRecord, values: list, ranks: list, page: str) -> disnake.Embed:
+    """Embed сравнения двух игроков по полям одной страницы с перцентилями"""
+    embed = disnake.Embed(
+        title=f"⚖️ {first.personaname} vs {second.personaname}",
+        description=f"**{COMPILED_PAGES[page][0]}**\nВ `%` — перцентиль среди всех известных боту профилей",
+        color=0xCD412B
+    )
+    
+    columns = ([], [], [])
+    for index, path in enumerate(SNAPSHOT_FIELDS):
+        if FIELD_PAGE[path] != page:
+            continue
+        a, b = values[0][index], values[1][index]
+        row = (FIELD_LABELS[path], compare_cell(a, ranks[0][index], a > b), compare_cell(b, ranks[1][index], b > a))
+        # Строки трёх колонок должны совпадать, поэтому обрезаются вместе
+        if any(sum(len(line) + 1 for line in column) + len(cell) > 1024 for column, cell in zip(columns, row)):
+            break
+        for column, cell in zip(columns, row):
+            column.append(cell)
+    
+    if not columns[0]:
+        embed.description += "\n\nНет числовых данных на этой странице"
+        return embed
+    for name, column in zip(("Показатель", first.personaname, second.personaname), columns):
+        embed.add_field(name=name[:256], value="\n".join(column), inline=True)
+    return embed
+
+
+class PageButton(disnake.ui.Button):
+    """Кнопка перехода на страницу StatsView"""
+    
+    def __init__(self, page: dict, steamid: str, author_id: int, card: bool = False):
+        super().__init__(
+            label=page["label"],
+            emoji=page["emoji"],
+            style=disnake.ButtonStyle.secondary,
+            row=page["row"],
+            custom_id=make_custom_id(steamid, page["key"], author_id, card)
+        )
+        self.page = page["key"]
+    
+    async def callback(self, inter: disnake.MessageInteraction):
+        await self.view.switch_page(inter, self.page)
+
+
+class SnapshotSelect(disnake.ui.StringSelect):
+    """Выбор более раннего снимка для страницы изменений"""
+    
+    def __init__(self, steamid: str, author_id: int, snapshots: list, selected: float, card: bool = False):
+        super().__init__(
+            placeholder="Сравнить со снимком...",
+            options=[
+                disnake.SelectOption(
+                    label=datetime.fromtimestamp(taken_at, timezone.utc).strftime("%d.%m.%Y %H:%M UTC"),
+                    value=repr(taken_at),
+                    default=taken_at == selected
+                )
+                for taken_at in snapshots
+            ],
+            row=4,
+            custom_id=make_custom_id(steamid, SNAPSHOT_SELECT_PAGE, author_id, card)
+        )
+    
+    async def callback(self, inter: disnake.MessageInteraction):
+        await self.view.select_snapshot(inter, float(self.values[0]))
 
 
 class StatsView(disnake.ui.View):
-    """View с кнопками для навигации по статистике"""
+    """View с кнопками для навигации по статистике
+    
+    View не хранит ответ API: данные берутся из кэша профилей кога, поэтому
+    его можно восстановить по custom_id кнопки в новом процессе. В режиме
+    card страницы показываются PNG-карточками вместо полей embed.
+    """
     
-    def __init__(self, data: dict, author_id: int):
+    def __init__(self, cog: "RustStats", steamid: str, author_id: int, page: str = "overview", card: bool = False):
         super().__init__(timeout=None)
-        self.data = data
+        self.cog = cog
+        self.steamid = steamid
         self.author_id = author_id
-        self.current_page = "overview"
+        self.current_page = page
+        self.card = card
+        self.compare_to: Optional[float] = None
+        for page_spec in PAGES:
+            self.add_item(PageButton(page_spec, steamid, author_id, card))
+        if cog.store is not None:
+            self.add_item(PageButton(DELTA_PAGE, steamid, author_id, card))
         self.update_buttons()
         
     async def interaction_check(self, inter: disnake.MessageInteraction) -> bool:
@@ -75,449 +1088,2839 @@ class StatsView(disnake.ui.View):
     
     def update_buttons(self):
         """Обновить состояние кнопок - отключить текущую страницу"""
-        button_mapping = {
-            "overview": 0,
-            "kills": 1,
-            "combat": 2,
-            "deaths": 3,
-            "gathered": 4,
-            "building": 5,
-            "exposure": 6,
-            "fishing": 7,
-            "other": 8,
-        }
-        
         for item in self.children:
-            if isinstance(item, disnake.ui.Button):
-                item.disabled = False
-        
-        current_index = button_mapping.get(self.current_page)
-        if current_index is not None and current_index < len(self.children):
-            self.children[current_index].disabled = True
-    
-    def get_base_embed(self) -> disnake.Embed:
-        """Базовый embed с информацией о профиле"""
-        embed = disnake.Embed(color=0xCD412B)
-        embed.set_author(
-            name=self.data.get("personaname", "Unknown"),
-            icon_url=self.data.get("avatar_url", ""),
-            url=f"https://steamcommunity.com/profiles/{self.data.get('steamid', '')}"
-        )
-        embed.set_thumbnail(url=self.data.get("avatar_full_url", ""))
-        
-        if self.data.get("is_private"):
-            embed.description = "🔒 **Профиль приватный** — данные могут быть устаревшими"
-        
-        # Статус в footer
-        status = []
-        if self.data.get("is_banned"):
-            status.append("🔨 ЗАБАНЕН")
-        if self.data.get("is_private"):
-            status.append("🔒 Приватный")
-        else:
-            status.append("🔓 Открытый")
-        
-        since_update = format_value(self.data.get("since_last_update", ""))
-        
-        embed.set_footer(
-            text=f"{' | '.join(status)} • SteamID: {self.data.get('steamid', 'N/A')} • Обновлено: {since_update} назад"
-        )
-        return embed
+            if isinstance(item, PageButton):
+                item.disabled = item.page == self.current_page
     
-    def get_overview_embed(self) -> disnake.Embed:
-        """Обзор профиля"""
-        embed = self.get_base_embed()
-        embed.title = "📊 Обзор профиля"
-        
-        overview = self.data.get("overview", {})
-        pvp = self.data.get("pvp_stats", {})
-        
-        embed.add_field(
-            name="⏱️ Время в игре",
-            value=f"```{format_value(overview.get('time_played'))}```",
-            inline=True
-        )
-        embed.add_field(
-            name="📅 Аккаунт создан",
-            value=f"```{format_value(overview.get('account_created'))}```",
-            inline=True
-        )
-        embed.add_field(
-            name="🎮 За 2 недели",
-            value=f"```{format_value(overview.get('played_last_2weeks'))}```",
-            inline=True
-        )
-        
-        embed.add_field(
-            name="⚔️ K/D Ratio",
-            value=f"```{format_value(pvp.get('kdr'))}```",
-            inline=True
-        )
-        embed.add_field(
-            name="💀 Убийства / Смерти",
-            value=f"```{format_value(pvp.get('kills'))} / {format_value(pvp.get('deaths'))}```",
-            inline=True
-        )
-        embed.add_field(
-            name="🎯 Точность",
-            value=f"```{format_value(pvp.get('bullets_hit_percent'))}```",
-            inline=True
-        )
-        
-        embed.add_field(
-            name="🎯 Хедшоты",
-            value=f"```{format_value(pvp.get('headshots'))} ({format_value(pvp.get('headshot_percent'))})```",
-            inline=True
-        )
-        embed.add_field(
-            name="🔫 Выстрелов / Попаданий",
-            value=f"```{format_value(pvp.get('bullets_fired'))} / {format_value(pvp.get('bullets_hit'))}```",
-            inline=True
-        )
-        embed.add_field(
-            name="🏆 Достижения",
-            value=f"```{format_value(overview.get('achievement_count'))}```",
-            inline=True
-        )
-        
-        return embed
+    def disable_all(self):
+        """Отключить все кнопки (view вытеснен из реестра)"""
+        for item in self.children:
+            if isinstance(item, (disnake.ui.Button, disnake.ui.StringSelect)):
+                item.disabled = True
     
-    def get_kills_embed(self) -> disnake.Embed:
-        """Статистика убийств"""
-        embed = self.get_base_embed()
-        embed.title = "💀 Статистика убийств"
-        
-        kills = self.data.get("kills", {})
-        
-        creatures = "\n".join([
-            stat_line("🧑", "Игроки", kills.get('players')),
-            stat_line("🔬", "Ученые", kills.get('scientists')),
-            stat_line("🐻", "Медведи", kills.get('bears')),
-            stat_line("🐗", "Кабаны", kills.get('boars')),
-            stat_line("🐺", "Волки", kills.get('wolves')),
-            stat_line("🦌", "Олени", kills.get('deer')),
-            stat_line("🐴", "Лошади", kills.get('horses')),
-            stat_line("🐔", "Куры", kills.get('chickens')),
-        ])
-        embed.add_field(name="🎯 Убийства существ", value=creatures, inline=True)
-        
-        other = self.data.get("other", {})
-        other_kills = "\n".join([
-            stat_line("🚀", "MLRS убийств", other.get('mlrs_kills')),
-            stat_line("🦈", "Из гарпуна", other.get('shark_speargun_kills')),
-            stat_line("🛢️", "Бочек", other.get('barrels_destroyed')),
-            stat_line("🚗", "Машин", other.get('cars_shredded')),
-        ])
-        embed.add_field(name="💥 Другое", value=other_kills, inline=True)
-        
-        melee = self.data.get("melee", {})
-        melee_stats = "\n".join([
-            stat_line("🗡️", "Ударов", melee.get('strikes')),
-            stat_line("🪃", "Бросков", melee.get('throws')),
-        ])
-        embed.add_field(name="⚔️ Ближний бой", value=melee_stats, inline=False)
-        
-        return embed
+    def get_current_embed(self) -> Optional[disnake.Embed]:
+        """Получить текущий embed или None, если профиля нет в кэше"""
+        entry = self.cog.profile_cache.peek(self.steamid)
+        if entry is None:
+            return None
+        return self.cog.embed_cache.get(self.steamid, entry.record.version, self.current_page, entry.record)
     
-    def get_combat_embed(self) -> disnake.Embed:
-        """Боевая статистика"""
-        embed = self.get_base_embed()
-        embed.title = "🔫 Боевая статистика"
-        
-        bullets = self.data.get("bullets_hit", {})
-        bow = self.data.get("bow_hits", {})
-        shotgun = self.data.get("shotgun_hits", {})
-        
-        bullet_stats = "\n".join([
-            stat_line("🧑", "В игроков", bullets.get('players')),
-            stat_line("🏠", "В строения", bullets.get('buildings')),
-            stat_line("💀", "В трупы", bullets.get('dead_players')),
-            stat_line("🐻", "В медведей", bullets.get('bears')),
-            stat_line("🐗", "В кабанов", bullets.get('boars')),
-            stat_line("🐺", "В волков", bullets.get('wolves')),
-            stat_line("🐴", "В лошадей", bullets.get('horses')),
-        ])
-        embed.add_field(name="🔫 Попадания пулями", value=bullet_stats, inline=True)
-        
-        bow_stats = "\n".join([
-            stat_line("🎯", "Точность", bow.get('rate')),
-            stat_line("🧑", "В игроков", bow.get('players')),
-            stat_line("🏠", "В строения", bow.get('buildings')),
-            stat_line("🐻", "В медведей", bow.get('bears')),
-            stat_line("🦌", "В оленей", bow.get('deer')),
-            stat_line("🏹", "Выстрелов", bow.get('shots_fired')),
-        ])
-        embed.add_field(name="🏹 Лук", value=bow_stats, inline=True)
-        
-        shotgun_stats = "\n".join([
-            stat_line("🧑", "В игроков", shotgun.get('players')),
-            stat_line("🏠", "В строения", shotgun.get('buildings')),
-            stat_line("🔫", "Выстрелов", shotgun.get('shots_fired')),
-        ])
-        embed.add_field(name="💥 Дробовик", value=shotgun_stats, inline=True)
-        
-        other = self.data.get("other", {})
-        embed.add_field(
-            name="🚀 Ракеты выпущено", 
-            value=f"```{format_value(other.get('rockets_fired'))}```", 
-            inline=False
-        )
-        
-        return embed
+    async def get_card_embed(self) -> Optional[disnake.Embed]:
+        """Embed с PNG-карточкой текущей страницы; при ошибке рендера — обычный embed"""
+        entry = self.cog.profile_cache.peek(self.steamid)
+        if entry is None:
+            return None
+        try:
+            path = await self.cog.cards.render(entry.record, self.current_page)
+            return self.card_embed(entry.record, path)
+        except Exception as e:
+            log.warning("Не удалось нарисовать карточку %s: %s", self.steamid, e)
+            return self.get_current_embed()
     
-    def get_deaths_embed(self) -> disnake.Embed:
-        """Статистика смертей и ранений"""
-        embed = self.get_base_embed()
-        embed.title = "☠️ Смерти и ранения"
-        
-        deaths = self.data.get("deaths", {})
-        wounds = self.data.get("wounds", {})
-        
-        death_stats = "\n".join([
-            stat_line("💀", "Всего смертей", deaths.get('total')),
-            stat_line("🪂", "От падения", deaths.get('fall')),
-            stat_line("🔫", "Суицид", deaths.get('suicide')),
-            stat_line("💥", "Самоповреждение", deaths.get('self_inflicted')),
-        ])
-        embed.add_field(name="💀 Смерти", value=death_stats, inline=True)
-        
-        wound_stats = "\n".join([
-            stat_line("🩸", "Ранен", wounds.get('wounded')),
-            stat_line("💊", "Исцелён", wounds.get('healed')),
-            stat_line("🤝", "Помог другим", wounds.get('assisted')),
-        ])
-        embed.add_field(name="🩹 Ранения", value=wound_stats, inline=True)
-        
+    @staticmethod
+    def card_embed(record: ProfileRecord, path: str) -> disnake.Embed:
+        embed = render_base_embed(record)
+        embed.set_image(file=disnake.File(path, filename="card.png"))
         return embed
     
-    def get_gathered_embed(self) -> disnake.Embed:
-        """Статистика добычи ресурсов"""
-        embed = self.get_base_embed()
-        embed.title = "⛏️ Добыча ресурсов"
-        
-        gathered = self.data.get("gathered", {})
-        consumed = self.data.get("consumed", {})
-        
-        resources = "\n".join([
-            stat_line("🪵", "Дерево", gathered.get('wood')),
-            stat_line("🪨", "Камень", gathered.get('stone')),
-            stat_line("⛏️", "Металл", gathered.get('metal_ore')),
-            stat_line("🔩", "Скрап", gathered.get('scrap')),
-            stat_line("🧵", "Ткань", gathered.get('cloth')),
-            stat_line("🛢️", "НК топливо", gathered.get('low_grade_fuel')),
-            stat_line("🐄", "Кожа", gathered.get('leather')),
-        ])
-        embed.add_field(name="📦 Ресурсы", value=resources, inline=True)
-        
-        hits = "\n".join([
-            stat_line("⛏️", "Ударов по руде", gathered.get('ore_hits')),
-            stat_line("🪓", "Ударов по дереву", gathered.get('tree_hits')),
-        ])
-        embed.add_field(name="🔨 Добыча", value=hits, inline=True)
-        
-        consumption = "\n".join([
-            stat_line("💧", "Воды выпито", consumed.get('water')),
-            stat_line("🍖", "Калорий съедено", consumed.get('calories')),
-        ])
-        embed.add_field(name="🍽️ Потребление", value=consumption, inline=False)
-        
-        return embed
+    def cached_card(self) -> Optional[Tuple[ProfileRecord, str]]:
+        """(профиль, путь) карточки текущей страницы, которую можно показать без рендера"""
+        entry = self.cog.profile_cache.peek(self.steamid)
+        if entry is None:
+            return None
+        path = self.cog.cards.cached(entry.record, self.current_page)
+        return (entry.record, path) if path is not None else None
     
-    def get_building_embed(self) -> disnake.Embed:
-        """Статистика строительства"""
-        embed = self.get_base_embed()
-        embed.title = "🏗️ Строительство и электричество"
-        
-        building = self.data.get("building_blocks", {})
-        other = self.data.get("other", {})
-        
-        build_stats = "\n".join([
-            stat_line("🧱", "Блоков установлено", building.get('placed')),
-            stat_line("⬆️", "Блоков улучшено", building.get('upgraded')),
-        ])
-        embed.add_field(name="🏠 Строительство", value=build_stats, inline=True)
-        
-        electric_stats = "\n".join([
-            stat_line("🔌", "Проводов", other.get('wires_connected')),
-            stat_line("🔧", "Труб", other.get('pipes_connected')),
-            stat_line("🔔", "Сигнализаций", other.get('tincanalarms_wired')),
-        ])
-        embed.add_field(name="⚡ Электричество", value=electric_stats, inline=True)
+    async def get_delta_embed(self, guild_id: Optional[int] = None) -> disnake.Embed:
+        """Страница изменений: последний снимок против выбранного (по умолчанию предыдущего)"""
+        self.remove_snapshot_select()
+        snapshots = await self.cog.store.snapshots(self.steamid, limit=26)
+        entry = self.cog.profile_cache.peek(self.steamid)
+        record = entry.record if entry else await self.cog.get_profile(self.steamid, guild_id)
         
-        embed.add_field(
-            name="📜 Чертежей изучено", 
-            value=f"```{format_value(other.get('bps_learned'))}```", 
-            inline=False
-        )
+        if len(snapshots) < 2:
+            embed = render_base_embed(record)
+            embed.title = DELTA_PAGE["title"]
+            embed.description = "Пока есть только один снимок статистики — изменения появятся после следующей проверки."
+            return embed
         
-        return embed
+        latest, earlier = snapshots[0], snapshots[1:]
+        chosen = next((snap for snap in earlier if snap[0] == self.compare_to), earlier[0])
+        self.add_item(SnapshotSelect(self.steamid, self.author_id, [snap[0] for snap in earlier], chosen[0], self.card))
+        return render_delta_embed(record, latest, chosen)
     
-    def get_exposure_embed(self) -> disnake.Embed:
-        """Статистика окружающей среды"""
-        embed = self.get_base_embed()
-        embed.title = "🌡️ Окружающая среда"
-        
-        exposure = self.data.get("exposure", {})
-        horse = self.data.get("horse_distance_ridden", {})
-        other = self.data.get("other", {})
-        
-        temp_stats = "\n".join([
-            stat_line("❄️", "На холоде", exposure.get('cold')),
-            stat_line("🔥", "На жаре", exposure.get('heat')),
-            stat_line("😌", "В комфорте", exposure.get('comfort')),
-            stat_line("☢️", "В радиации", exposure.get('radiation')),
-        ])
-        embed.add_field(name="🌡️ Температура", value=temp_stats, inline=True)
-        
-        transport = "\n".join([
-            stat_line("🐴", "На лошади", f"{format_value(horse.get('kilometers'))} км"),
-            stat_line("🏇", "Раз садился", horse.get('mounted_times')),
-            stat_line("🚁", "Посадок на вертолётную", other.get('helipad_landings')),
-            stat_line("🛶", "На каяке", other.get('kayak_distance_travelled')),
-        ])
-        embed.add_field(name="🚗 Транспорт", value=transport, inline=True)
+    def remove_snapshot_select(self):
+        for item in list(self.children):
+            if isinstance(item, SnapshotSelect):
+                self.remove_item(item)
+    
+    async def select_snapshot(self, inter: disnake.MessageInteraction, taken_at: float):
+        """Выбрать снимок для сравнения"""
+        self.compare_to = taken_at
+        await self.switch_page(inter, DELTA_PAGE["key"])
+    
+    async def switch_page(self, inter: disnake.MessageInteraction, page: str):
+        """Переключить страницу"""
+        self.current_page = page
+        self.update_buttons()
+        self.cog.views.touch(inter.message.id)
         
-        return embed
+        trace = self.cog.metrics.trace("switch_page")
+        outcome = "error"
+        try:
+            outcome = await self._switch_page(inter, page, trace)
+        finally:
+            trace.finish(outcome)
     
-    def get_other_embed(self) -> disnake.Embed:
-        """Другая статистика"""
-        embed = self.get_base_embed()
-        embed.title = "📋 Другое"
-        
-        other = self.data.get("other", {})
-        menus = self.data.get("menus_opened", {})
-        instruments = self.data.get("instruments", {})
-        
-        menu_stats = "\n".join([
-            stat_line("🎒", "Инвентарь", menus.get('inventory')),
-            stat_line("🗺️", "Карта", menus.get('map')),
-            stat_line("🔨", "Крафт", menus.get('crafting')),
-            stat_line("🏠", "Шкаф", menus.get('cupboard')),
-        ])
-        embed.add_field(name="📂 Открытий меню", value=menu_stats, inline=True)
-        
-        misc_stats = "\n".join([
-            stat_line("🎤", "Голосовой чат", other.get('voicechat_time')),
-            stat_line("👋", "Помахал игрокам", other.get('waved_at_players')),
-            stat_line("📦", "Выброшено", other.get('items_dropped')),
-            stat_line("🔍", "Осмотрено", other.get('items_inspected')),
-            stat_line("📋", "Миссий", other.get('missions_completed')),
-            stat_line("🐝", "Атак пчёл", other.get('bee_attacks_count')),
-        ])
-        embed.add_field(name="🎲 Разное", value=misc_stats, inline=True)
-        
-        music_stats = "\n".join([
-            stat_line("🎵", "Нот сыграно", instruments.get('notes_played')),
-            stat_line("🎹", "Бинды нот", instruments.get('note_binds')),
-        ])
-        embed.add_field(name="🎸 Музыка", value=music_stats, inline=False)
+    async def _switch_page(self, inter: disnake.MessageInteraction, page: str, trace: "Trace") -> str:
+        """Показать страницу и вернуть метку исхода для метрик"""
+        if page == DELTA_PAGE["key"]:
+            with trace.stage("defer"):
+                await inter.response.defer()
+            try:
+                with trace.stage("render"):
+                    embed = await self.get_delta_embed(inter.guild_id)
+            except Exception as e:
+                await inter.followup.send(f"❌ Не удалось загрузить историю: {e}", ephemeral=True)
+                return outcome_of(e)
+            with trace.stage("send"):
+                await inter.edit_original_response(embed=embed, view=self, attachments=[])
+            return "ok"
         
-        return embed
+        self.remove_snapshot_select()
+        if self.card:
+            return await self._switch_card(inter, trace)
+        
+        with trace.stage("render"):
+            embed = self.get_current_embed()
+        if embed is not None:
+            with trace.stage("send"):
+                await inter.response.edit_message(embed=embed, view=self)
+            return "ok"
+        
+        # Профиль вытеснен из кэша — загружаем заново
+        with trace.stage("defer"):
+            await inter.response.defer()
+        try:
+            await self.cog.get_profile(self.steamid, inter.guild_id)
+        except Exception as e:
+            await inter.followup.send(f"❌ Не удалось загрузить профиль: {e}", ephemeral=True)
+            return outcome_of(e)
+        with trace.stage("render"):
+            embed = self.get_current_embed()
+        if embed is None:
+            return "404"
+        with trace.stage("send"):
+            await inter.edit_original_response(embed=embed, view=self)
+        return "ok"
     
-    def get_fishing_embed(self) -> disnake.Embed:
-        """Статистика рыбалки"""
-        embed = self.get_base_embed()
-        embed.title = "🎣 Рыбалка"
-        
-        fishing = self.data.get("fishing", {})
-        
-        fish_col1 = "\n".join([
-            stat_line("🐟", "Лосось", fishing.get('caught_salmon')),
-            stat_line("🐟", "Анчоус", fishing.get('caught_anchovy')),
-            stat_line("🐟", "Сом", fishing.get('caught_catfish')),
-            stat_line("🐟", "Сельдь", fishing.get('caught_herring')),
-            stat_line("🐟", "Сардина", fishing.get('caught_sardine')),
-        ])
-        embed.add_field(name="🐠 Рыба (1)", value=fish_col1, inline=True)
-        
-        fish_col2 = "\n".join([
-            stat_line("🦈", "Маленькая акула", fishing.get('caught_small_shark')),
-            stat_line("🐟", "Форель", fishing.get('caught_small_trout')),
-            stat_line("🐟", "Жёлтый окунь", fishing.get('caught_yellow_perch')),
-            stat_line("🐟", "Оранжевый ёрш", fishing.get('caught_orange_roughy')),
-        ])
-        embed.add_field(name="🐠 Рыба (2)", value=fish_col2, inline=True)
+    async def _switch_card(self, inter: disnake.MessageInteraction, trace: "Trace") -> str:
+        """Показать карточку страницы; рендер в пуле процессов идёт после defer"""
+        cached = self.cached_card()
+        if cached is not None:
+            try:
+                with trace.stage("render"):
+                    embed = self.card_embed(*cached)
+            except OSError:
+                # Файл успел удалить prune — карточка нарисуется заново после defer
+                cached = None
+        if cached is not None:
+            with trace.stage("send"):
+                await inter.response.edit_message(embed=embed, view=self, attachments=[])
+            return "ok"
         
-        return embed
+        with trace.stage("defer"):
+            await inter.response.defer()
+        try:
+            if self.cog.profile_cache.peek(self.steamid) is None:
+                await self.cog.get_profile(self.steamid, inter.guild_id)
+            with trace.stage("render"):
+                embed = await self.get_card_embed()
+        except Exception as e:
+            await inter.followup.send(f"❌ Не удалось загрузить профиль: {e}", ephemeral=True)
+            return outcome_of(e)
+        if embed is None:
+            return "404"
+        with trace.stage("send"):
+            await inter.edit_original_response(embed=embed, view=self, attachments=[])
+        return "ok"
+
+
+class LeaderboardView(disnake.ui.View):
+    """Постраничная таблица лидеров гильдии по одной метрике"""
     
-    def get_current_embed(self) -> disnake.Embed:
-        """Получить текущий embed"""
-        embeds = {
-            "overview": self.get_overview_embed,
-            "kills": self.get_kills_embed,
-            "combat": self.get_combat_embed,
-            "deaths": self.get_deaths_embed,
-            "gathered": self.get_gathered_embed,
-            "building": self.get_building_embed,
-            "exposure": self.get_exposure_embed,
-            "fishing": self.get_fishing_embed,
-            "other": self.get_other_embed,
-        }
-        return embeds.get(self.current_page, self.get_overview_embed)()
+    def __init__(self, cog: "RustStats", guild_id: int, metric: str, author_id: int):
+        super().__init__(timeout=LEADERBOARD_VIEW_TIMEOUT)
+        self.cog = cog
+        self.guild_id = guild_id
+        self.metric = metric
+        self.author_id = author_id
+        self.page = 0
+        self.update_buttons()
     
-    async def switch_page(self, inter: disnake.MessageInteraction, page: str):
-        """Переключить страницу"""
-        self.current_page = page
+    async def interaction_check(self, inter: disnake.MessageInteraction) -> bool:
+        """Проверка что только автор может использовать кнопки"""
+        if inter.author.id != self.author_id:
+            await inter.response.send_message(
+                "❌ Только автор команды может использовать эти кнопки!", 
+                ephemeral=True
+            )
+            return False
+        return True
+    
+    @property
+    def page_count(self) -> int:
+        ranked = self.cog.leaderboard.ranked(self.guild_id, self.metric)
+        return max(1, -(-ranked // LEADERBOARD_PAGE_SIZE))
+    
+    def update_buttons(self):
+        """Отключить кнопки на краях таблицы"""
+        self.previous_button.disabled = self.page == 0
+        self.next_button.disabled = self.page >= self.page_count - 1
+    
+    def get_current_embed(self) -> disnake.Embed:
+        title, _ = LEADERBOARD_METRICS[self.metric]
+        offset = self.page * LEADERBOARD_PAGE_SIZE
+        rows = self.cog.leaderboard.top(self.guild_id, self.metric, offset, LEADERBOARD_PAGE_SIZE)
+        
+        embed = disnake.Embed(title=f"🏆 Топ: {title}", color=0xCD412B)
+        if not rows:
+            embed.description = "Пока никто не привязал Steam ID. Используйте `/check link`."
+        else:
+            medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+            lines = []
+            for place, (user_id, value) in enumerate(rows, start=offset + 1):
+                steamid = self.cog.leaderboard.links.get(self.guild_id, {}).get(user_id)
+                entry = self.cog.profile_cache.peek(steamid) if steamid else None
+                name = f" ({entry.record.personaname})" if entry else ""
+                lines.append(f"{medals.get(place, f'`#{place}`')} <@{user_id}>{name}: **{format_number(value)}**")
+            embed.description = "\n".join(lines)
+        embed.set_footer(text=f"Страница {self.page + 1} / {self.page_count}")
+        return embed
+    
+    async def switch_page(self, inter: disnake.MessageInteraction, page: int):
+        """Переключить страницу"""
+        self.page = max(0, min(page, self.page_count - 1))
         self.update_buttons()
         await inter.response.edit_message(embed=self.get_current_embed(), view=self)
     
-    @disnake.ui.button(label="Обзор", style=disnake.ButtonStyle.secondary, emoji="📊", row=0)
-    async def overview_button(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
-        await self.switch_page(inter, "overview")
+    @disnake.ui.button(label="Назад", style=disnake.ButtonStyle.secondary, emoji="◀️", row=0)
+    async def previous_button(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
+        await self.switch_page(inter, self.page - 1)
+    
+    @disnake.ui.button(label="Вперёд", style=disnake.ButtonStyle.secondary, emoji="▶️", row=0)
+    async def next_button(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
+        await self.switch_page(inter, self.page + 1)
+
+
+class CompareView(disnake.ui.View):
+    """Постраничное сравнение двух игроков по категориям StatsView"""
+    
+    def __init__(self, cog: "RustStats", first: ProfileRecord, second: ProfileRecord, author_id: int):
+        super().__init__(timeout=COMPARE_VIEW_TIMEOUT)
+        self.cog = cog
+        self.records = (first, second)
+        self.values = [snapshot_values(first), snapshot_values(second)]
+        self.author_id = author_id
+        self.current_page = "overview"
+        for page in PAGES:
+            button = disnake.ui.Button(label=page["label"], emoji=page["emoji"], row=page["row"])
+            button.callback = self._page_callback(page["key"])
+            self.add_item(button)
+        self.update_buttons()
+    
+    def _page_callback(self, page: str):
+        async def callback(inter: disnake.MessageInteraction):
+            await self.switch_page(inter, page)
+        return callback
+    
+    async def interaction_check(self, inter: disnake.MessageInteraction) -> bool:
+        """Проверка что только автор может использовать кнопки"""
+        if inter.author.id != self.author_id:
+            await inter.response.send_message(
+                "❌ Только автор команды может использовать эти кнопки!", 
+                ephemeral=True
+            )
+            return False
+        return True
+    
+    def update_buttons(self):
+        for item, page in zip(self.children, PAGES):
+            item.disabled = page["key"] == self.current_page
+    
+    async def get_current_embed(self) -> disnake.Embed:
+        steamids = tuple(record.steamid for record in self.records if record.steamid)
+        ranks = await self.cog.population.percentiles(self.values, steamids)
+        embed = render_compare_embed(*self.records, self.values, ranks, self.current_page)
+        embed.set_footer(text=f"Профилей в выборке: {len(self.cog.population)}")
+        return embed
+    
+    async def switch_page(self, inter: disnake.MessageInteraction, page: str):
+        """Переключить страницу"""
+        self.current_page = page
+        self.update_buttons()
+        await inter.response.edit_message(embed=await self.get_current_embed(), view=self)
+
+
+class ViewRegistry:
+    """Ограниченный реестр живых StatsView с LRU-вытеснением
+    
+    У вытесненного view отключаются кнопки на сообщении, а сам он
+    останавливается и больше не держится disnake.
+    """
+    
+    def __init__(self, bot: commands.Bot, max_views: int = VIEW_REGISTRY_SIZE):
+        self.bot = bot
+        self.max_views = max_views
+        self._views: "OrderedDict[int, Tuple[int, StatsView]]" = OrderedDict()
+        self._tasks: set = set()
+        self.evictions = 0
+    
+    def __contains__(self, message_id: int) -> bool:
+        return message_id in self._views
+    
+    def __len__(self) -> int:
+        return len(self._views)
+    
+    def add(self, channel_id: int, message_id: int, view: StatsView):
+        self._views[message_id] = (channel_id, view)
+        self._views.move_to_end(message_id)
+        while len(self._views) > self.max_views:
+            old_id, (old_channel_id, old_view) = self._views.popitem(last=False)
+            self.evictions += 1
+            self._evict(old_channel_id, old_id, old_view)
+    
+    def touch(self, message_id: int):
+        if message_id in self._views:
+            self._views.move_to_end(message_id)
+    
+    def clear(self):
+        """Остановить все view без изменения сообщений (выгрузка кога)"""
+        for _, view in self._views.values():
+            view.stop()
+        self._views.clear()
+        for task in self._tasks:
+            task.cancel()
+    
+    def _evict(self, channel_id: int, message_id: int, view: StatsView):
+        view.stop()
+        view.disable_all()
+        task = asyncio.ensure_future(self._disable_message(channel_id, message_id, view))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _disable_message(self, channel_id: int, message_id: int, view: StatsView):
+        try:
+            channel = self.bot.get_partial_messageable(channel_id)
+            await channel.get_partial_message(message_id).edit(view=view)
+        except disnake.HTTPException as e:
+            log.debug("Не удалось отключить кнопки сообщения %s: %s", message_id, e)
+    
+    def stats(self) -> dict:
+        return {
+            "size": len(self._views),
+            "max_size": self.max_views,
+            "evictions": self.evictions,
+        }
+
+
+class ProfileNotFound(Exception):
+    """Профиль не найден в ruststats.io"""
+
+
+class UpstreamError(Exception):
+    """ruststats.io вернул неожиданный код ответа"""
+    
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class RateLimited(UpstreamError):
+    """ruststats.io ограничил частоту запросов (429)"""
+    
+    def __init__(self, retry_after: float):
+        super().__init__(429)
+        self.retry_after = retry_after
+
+
+def clamp_retry_after(seconds: float) -> float:
+    """Пауза в пределах [0, UPSTREAM_RETRY_AFTER_CAP]; inf и NaN заменяются паузой по умолчанию"""
+    if not math.isfinite(seconds):
+        return UPSTREAM_DEFAULT_RETRY_AFTER
+    return min(max(0.0, seconds), UPSTREAM_RETRY_AFTER_CAP)
+
+
+def parse_retry_after(value: Optional[str]) -> float:
+    """Заголовок Retry-After (секунды или HTTP-дата) в секунды ожидания"""
+    if not value:
+        return UPSTREAM_DEFAULT_RETRY_AFTER
+    try:
+        return clamp_retry_after(float(value))
+    except ValueError:
+        pass
+    try:
+        return clamp_retry_after(parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, OverflowError):
+        return UPSTREAM_DEFAULT_RETRY_AFTER
+
+
+class UpstreamLimiter:
+    """Token bucket для запросов к ruststats.io с честной очередью по гильдиям
+    
+    Пока токены есть и очередь пуста, запрос проходит сразу. Иначе он ждёт в
+    очереди своей гильдии; очереди обслуживаются по кругу, по одному запросу
+    за раз, поэтому одна загруженная гильдия не задерживает остальные.
+    """
+    
+    def __init__(self, rate: float = UPSTREAM_RATE, burst: int = UPSTREAM_BURST):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._queues: "OrderedDict[int, deque]" = OrderedDict()
+        self._dispatcher: Optional[asyncio.Task] = None
+        
+        self.acquired = 0
+        self.queued = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+    
+    @property
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+    
+    async def acquire(self, guild_id: Optional[int] = None):
+        """Дождаться токена для запроса от гильдии"""
+        self.acquired += 1
+        if not self._queues and self._delay() == 0:
+            self.tokens -= 1
+            return
+        
+        key = guild_id or 0
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(key, deque()).append(future)
+        self.queued += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        
+        started = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Отменённый ожидающий сразу уходит из очереди и не искажает depth
+            queue = self._queues.get(key)
+            if queue is not None and future in queue:
+                queue.remove(future)
+                if not queue:
+                    del self._queues[key]
+            raise
+        finally:
+            waited = time.monotonic() - started
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+    
+    def penalize(self, retry_after: float):
+        """Не выдавать токены retry_after секунд (ответ 429)"""
+        self.throttled += 1
+        self.blocked_until = max(self.blocked_until, time.monotonic() + clamp_retry_after(retry_after))
+        self.tokens = 0.0
+    
+    def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+        for queue in self._queues.values():
+            for future in queue:
+                future.cancel()
+        self._queues.clear()
+    
+    def _delay(self) -> float:
+        """Сколько ждать до следующего токена"""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+    
+    async def _dispatch(self):
+        while self._queues:
+            delay = self._delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            
+            guild_id = next(iter(self._queues))
+            queue = self._queues[guild_id]
+            future = queue.popleft()
+            if queue:
+                self._queues.move_to_end(guild_id)
+            else:
+                del self._queues[guild_id]
+            
+            if not future.done():
+                self.tokens -= 1
+                future.set_result(None)
+    
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "guilds": len(self._queues),
+            "acquired": self.acquired,
+            "queued": self.queued,
+            "throttled": self.throttled,
+            "avg_wait": self.total_wait / self.queued if self.queued else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
+class CircuitOpen(Exception):
+    """Запросы к ruststats.io временно не выполняются (circuit breaker разомкнут)"""
+
+
+class CircuitBreaker:
+    """Circuit breaker для ruststats.io
+    
+    После failure_threshold ошибок подряд размыкается и сразу отклоняет
+    запросы. Через reset_timeout пропускает один пробный запрос (half-open):
+    успех замыкает цепь, ошибка снова размыкает.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+        
+        self.trips = 0
+        self.rejected = 0
+    
+    def allow(self) -> bool:
+        """Можно ли сейчас отправить запрос"""
+        if self.state == self.CLOSED:
+            return True
+        
+        now = time.monotonic()
+        if self.state == self.OPEN and now - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self.probe_started = now
+            return True
+        # Пробный запрос мог потеряться (отмена) — через reset_timeout пускаем новый
+        if self.state == self.HALF_OPEN and now - self.probe_started >= self.reset_timeout:
+            self.probe_started = now
+            return True
+        
+        self.rejected += 1
+        return False
+    
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+    
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.trips += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+    
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+def coordinator_line(message: dict) -> bytes:
+    """Строка протокола координатора; без \\uXXXX, чтобы кириллица не раздувала тела профилей"""
+    return json.dumps(message, ensure_ascii=False).encode() + b"\n"
+
+
+class CoordinatorClient:
+    """Подключение шарда к координатору по Unix-сокету
+    
+    Обмен строками JSON; ответы сопоставляются с запросами по id, поэтому
+    ожидание токена не блокирует запросы к кэшу. Если координатор недоступен,
+    методы сразу возвращают False/None, и шард работает сам по себе, пока
+    через COORDINATOR_RETRY секунд не получится подключиться снова.
+    """
+    
+    def __init__(self, path: str, timeout: float = COORDINATOR_TIMEOUT, retry: float = COORDINATOR_RETRY):
+        self.path = path
+        self.timeout = timeout
+        self.retry = retry
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: dict = {}
+        self._next_id = 0
+        self._retry_at = 0.0
+        self._lock = asyncio.Lock()
+        
+        self.requests = 0
+        self.failures = 0
+        self.hits = 0
+        self.misses = 0
+        self.puts = 0
+    
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+    
+    async def _connect(self) -> bool:
+        if self.connected:
+            return True
+        if time.monotonic() < self._retry_at:
+            return False
+        
+        async with self._lock:
+            if self.connected:
+                return True
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self.path, limit=COORDINATOR_LINE_LIMIT)
+            except OSError as e:
+                log.warning("Координатор %s недоступен: %s", self.path, e)
+                self._retry_at = time.monotonic() + self.retry
+                return False
+            self._reader_task = asyncio.ensure_future(self._read(reader))
+            return True
+    
+    async def _read(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Строка длиннее COORDINATOR_LINE_LIMIT: пропускаем её, соединение живо
+                    log.warning("Слишком длинный ответ координатора %s пропущен", self.path)
+                    continue
+                if not line:
+                    break
+                try:
+                    message = json_loads(line)
+                except ValueError:
+                    continue
+                future = self._pending.pop(message.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(message)
+        except OSError as e:
+            log.warning("Соединение с координатором %s прервано: %s", self.path, e)
+        finally:
+            self._disconnected()
+    
+    def _disconnected(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._retry_at = time.monotonic() + self.retry
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("coordinator disconnected"))
+        self._pending.clear()
+    
+    def _notify(self, message: dict):
+        """Сообщение без ответа; без соединения просто теряется"""
+        if self.connected:
+            self._writer.write(coordinator_line(message))
+    
+    async def _call(self, message: dict, timeout: Optional[float]) -> Optional[dict]:
+        """Ответ координатора или None, если он недоступен; не ответил вовремя — asyncio.TimeoutError"""
+        if not await self._connect():
+            return None
+        
+        self.requests += 1
+        self._next_id += 1
+        message_id = message["id"] = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        try:
+            self._notify(message)
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.failures += 1
+            # Координатор не должен выдавать токен, который уже никто не ждёт
+            self._notify({"op": "cancel", "ref": message_id})
+            raise
+        except asyncio.CancelledError:
+            self._notify({"op": "cancel", "ref": message_id})
+            raise
+        except ConnectionError:
+            self.failures += 1
+            return None
+        finally:
+            self._pending.pop(message_id, None)
+    
+    async def acquire(self, guild_id: Optional[int] = None, timeout: float = COORDINATOR_ACQUIRE_TIMEOUT) -> bool:
+        """Дождаться токена из общего бюджета; False — координатор недоступен
+        
+        Долгое ожидание означает, что общий бюджет исчерпан (или ruststats.io
+        прислал 429 и координатор держит паузу). Локальный лимит в этот момент
+        снова умножил бы нагрузку на число шардов, поэтому запрос отклоняется.
+        """
+        try:
+            reply = await self._call({"op": "acquire", "guild": guild_id}, timeout)
+        except asyncio.TimeoutError:
+            raise RateLimited(timeout)
+        return reply is not None
+    
+    def penalize(self, retry_after: float):
+        self._notify({"op": "penalize", "retry_after": retry_after})
+    
+    async def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        """(тело ответа get_profile, time.time() получения) по ключу кэша"""
+        try:
+            reply = await self._call({"op": "get", "key": key}, self.timeout)
+        except asyncio.TimeoutError:
+            reply = None
+        if reply is None or reply.get("body") is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return reply["body"].encode(), reply["fetched_at"]
+    
+    def put(self, steamid: str, body: bytes, fetched_at: float, aliases: tuple = ()):
+        """Поделиться ответом; aliases — другие ключи кэша того же профиля (vanity:имя)"""
+        if self.connected and len(body) <= COORDINATOR_MAX_BODY:
+            self.puts += 1
+            self._notify({
+                "op": "put", "key": steamid, "body": body.decode(),
+                "fetched_at": fetched_at, "aliases": list(aliases),
+            })
+    
+    def close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+    
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected,
+            "requests": self.requests,
+            "failures": self.failures,
+            "hits": self.hits,
+            "misses": self.misses,
+            "puts": self.puts,
+        }
+
+
+class SharedLimiter:
+    """Лимит запросов шарда: токены из общего бюджета координатора
+    
+    Только пока координатор недоступен (нет соединения или оно оборвалось),
+    запросы проходят через локальный UpstreamLimiter, чтобы шард не остался
+    вовсе без лимита. Медленный, но живой координатор не обходится.
+    """
+    
+    def __init__(self, client: CoordinatorClient, local: UpstreamLimiter):
+        self.client = client
+        self.local = local
+        self.shared = 0
+    
+    @property
+    def depth(self) -> int:
+        return self.local.depth
+    
+    async def acquire(self, guild_id: Optional[int] = None):
+        if await self.client.acquire(guild_id):
+            self.shared += 1
+            return
+        await self.local.acquire(guild_id)
+    
+    def penalize(self, retry_after: float):
+        self.local.penalize(retry_after)
+        self.client.penalize(retry_after)
+    
+    def close(self):
+        self.local.close()
+    
+    def stats(self) -> dict:
+        return dict(self.local.stats(), shared=self.shared)
+
+
+class Coordinator:
+    """Координатор шардов: один бюджет запросов к ruststats.io и общий кэш ответов
+    
+    Шарды на одном хосте подключаются по Unix-сокету. Токены выдаются тем же
+    UpstreamLimiter с очередями по гильдиям, что и в одиночном процессе.
+    Кэш хранит сырые ответы get_profile со временем получения; свежесть
+    каждый шард проверяет сам по своему TTL.
+    """
+    
+    def __init__(
+        self,
+        rate: float = UPSTREAM_RATE,
+        burst: int = UPSTREAM_BURST,
+        max_size: int = PROFILE_CACHE_SIZE,
+        max_age: float = PROFILE_CACHE_MAX_TTL,
+    ):
+        self.limiter = UpstreamLimiter(rate, burst)
+        self.max_size = max_size
+        self.max_age = max_age
+        self._bodies: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._aliases: "OrderedDict[str, str]" = OrderedDict()
+        self.clients = 0
+    
+    async def serve(self, path: str):
+        if os.path.exists(path):
+            # Сокет от прошлого запуска
+            os.unlink(path)
+        server = await asyncio.start_unix_server(self.handle, path, limit=COORDINATOR_LINE_LIMIT)
+        log.info("Координатор слушает %s", path)
+        async with server:
+            await server.serve_forever()
+    
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.clients += 1
+        grants: dict = {}
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Строка длиннее COORDINATOR_LINE_LIMIT: пропускаем её, соединение живо
+                    log.warning("Слишком длинное сообщение шарда пропущено")
+                    continue
+                if not line:
+                    break
+                try:
+                    message = json_loads(line)
+                    if message.get("op") == "acquire":
+                        message_id = message["id"]
+                        task = asyncio.ensure_future(self._grant(writer, message))
+                        grants[message_id] = task
+                        task.add_done_callback(lambda _, message_id=message_id: grants.pop(message_id, None))
+                        continue
+                    if message.get("op") == "cancel":
+                        task = grants.get(message.get("ref"))
+                        if task is not None:
+                            task.cancel()
+                        continue
+                    reply = self.dispatch(message)
+                except (KeyError, TypeError, ValueError, AttributeError) as e:
+                    log.warning("Некорректное сообщение шарда пропущено: %r", e)
+                    continue
+                if reply is not None and "id" in message:
+                    self._reply(writer, message["id"], reply)
+        except OSError:
+            pass
+        finally:
+            # Токены отключившемуся шарду больше не нужны
+            for task in list(grants.values()):
+                task.cancel()
+            self.clients -= 1
+            writer.close()
+    
+    def _reply(self, writer: asyncio.StreamWriter, message_id: int, reply: dict):
+        if not writer.is_closing():
+            reply["id"] = message_id
+            writer.write(coordinator_line(reply))
+    
+    async def _grant(self, writer: asyncio.StreamWriter, message: dict):
+        await self.limiter.acquire(message.get("guild"))
+        self._reply(writer, message["id"], {"ok": True})
+    
+    def dispatch(self, message: dict) -> Optional[dict]:
+        op = message.get("op")
+        if op == "get":
+            return self.get(message.get("key"))
+        if op == "put":
+            self.put(message["key"], message["body"], message["fetched_at"], message.get("aliases") or ())
+        elif op == "penalize":
+            self.limiter.penalize(float(message.get("retry_after") or UPSTREAM_DEFAULT_RETRY_AFTER))
+        elif op == "stats":
+            return self.stats()
+        return None
+    
+    def get(self, key: str) -> dict:
+        steamid = self._aliases.get(key, key)
+        entry = self._bodies.get(steamid)
+        if entry is None or time.time() - entry[1] > self.max_age:
+            return {"body": None}
+        self._bodies.move_to_end(steamid)
+        return {"body": entry[0], "fetched_at": entry[1]}
+    
+    def put(self, steamid: str, body: str, fetched_at: float, aliases):
+        previous = self._bodies.get(steamid)
+        if previous is not None and previous[1] > fetched_at:
+            return
+        self._bodies[steamid] = (body, fetched_at)
+        self._bodies.move_to_end(steamid)
+        if len(self._bodies) > self.max_size:
+            self._bodies.popitem(last=False)
+        for alias in aliases:
+            self._aliases[alias] = steamid
+            self._aliases.move_to_end(alias)
+            if len(self._aliases) > self.max_size:
+                self._aliases.popitem(last=False)
+    
+    def stats(self) -> dict:
+        return dict(self.limiter.stats(), clients=self.clients, profiles=len(self._bodies))
+
+
+class AdmissionRejected(Exception):
+    """Команда не допущена: очередь полна или ожидание превысит предел"""
+    
+    def __init__(self, retry_after: float):
+        super().__init__(f"Busy, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """Место команды: сразу допущена или ждёт в очереди; release() обязателен"""
+    
+    __slots__ = ("controller", "guild_id", "future", "state", "enqueued_at", "admitted_at")
+    
+    def __init__(self, controller: "AdmissionController", guild_id: Optional[int]):
+        self.controller = controller
+        self.guild_id = guild_id
+        self.future: Optional[asyncio.Future] = None
+        self.state = "queued"
+        self.enqueued_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+    
+    async def wait(self):
+        await self.controller._wait(self)
+    
+    def release(self):
+        self.controller._release(self)
+
+
+class AdmissionController:
+    """Допуск команд: лимиты одновременных на гильдию и всего плюс ограниченная очередь
+    
+    Ожидание оценивается по очереди впереди и скользящему среднему времени
+    выполнения команды. Если оценка больше max_wait, команда отклоняется
+    сразу, а не держит задачу, пока не истечёт взаимодействие.
+    """
+    
+    def __init__(
+        self,
+        global_limit: int = ADMISSION_GLOBAL_LIMIT,
+        guild_limit: int = ADMISSION_GUILD_LIMIT,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        max_wait: float = ADMISSION_MAX_WAIT,
+    ):
+        self.global_limit = global_limit
+        self.guild_limit = guild_limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.active = 0
+        self._guild_active: dict = {}
+        self._guild_queued: dict = {}
+        self._queue: deque = deque()
+        self.service_time = 1.0
+        
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.max_depth = 0
+    
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+    
+    def _can_run(self, guild_id: Optional[int]) -> bool:
+        return self.active < self.global_limit and self._guild_active.get(guild_id, 0) < self.guild_limit
+    
+    def estimate(self, guild_id: Optional[int]) -> float:
+        """Ожидаемое время в очереди новой команды гильдии (секунды)"""
+        waves = max(
+            (len(self._queue) + 1) / self.global_limit,
+            (self._guild_queued.get(guild_id, 0) + 1) / self.guild_limit,
+        )
+        return waves * self.service_time
+    
+    def enter(self, guild_id: Optional[int]) -> AdmissionTicket:
+        """Допустить, поставить в очередь или отклонить (AdmissionRejected) без ожидания"""
+        ticket = AdmissionTicket(self, guild_id)
+        if self._can_run(guild_id):
+            self._grant(ticket)
+            return ticket
+        
+        wait = self.estimate(guild_id)
+        if len(self._queue) >= self.queue_size or wait > self.max_wait:
+            self.rejected += 1
+            raise AdmissionRejected(wait)
+        ticket.future = asyncio.get_running_loop().create_future()
+        self._queue.append(ticket)
+        self._guild_queued[guild_id] = self._guild_queued.get(guild_id, 0) + 1
+        self.queued += 1
+        self.max_depth = max(self.max_depth, len(self._queue))
+        return ticket
+    
+    def _grant(self, ticket: AdmissionTicket):
+        ticket.state = "admitted"
+        ticket.admitted_at = time.monotonic()
+        self.active += 1
+        self._guild_active[ticket.guild_id] = self._guild_active.get(ticket.guild_id, 0) + 1
+        self.admitted += 1
+    
+    def _unqueue(self, ticket: AdmissionTicket):
+        self._queue.remove(ticket)
+        count = self._guild_queued[ticket.guild_id] - 1
+        if count:
+            self._guild_queued[ticket.guild_id] = count
+        else:
+            del self._guild_queued[ticket.guild_id]
+    
+    async def _wait(self, ticket: AdmissionTicket):
+        if ticket.state != "queued":
+            return
+        timeout = self.max_wait - (time.monotonic() - ticket.enqueued_at)
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), max(timeout, 0))
+        except asyncio.TimeoutError:
+            if ticket.state == "admitted":
+                return
+            self._unqueue(ticket)
+            ticket.state = "done"
+            self.timeouts += 1
+            raise AdmissionRejected(self.estimate(ticket.guild_id))
+    
+    def _release(self, ticket: AdmissionTicket):
+        if ticket.state == "queued":
+            self._unqueue(ticket)
+        elif ticket.state == "admitted":
+            self.active -= 1
+            count = self._guild_active[ticket.guild_id] - 1
+            if count:
+                self._guild_active[ticket.guild_id] = count
+            else:
+                del self._guild_active[ticket.guild_id]
+            self.service_time += 0.2 * (time.monotonic() - ticket.admitted_at - self.service_time)
+        ticket.state = "done"
+        self._dispatch()
+    
+    def _dispatch(self):
+        """Допустить ожидающих по порядку, пропуская гильдии, упёршиеся в свой лимит"""
+        index = 0
+        while index < len(self._queue) and self.active < self.global_limit:
+            ticket = self._queue[index]
+            if self._guild_active.get(ticket.guild_id, 0) >= self.guild_limit:
+                index += 1
+                continue
+            self._unqueue(ticket)
+            self._grant(ticket)
+            ticket.future.set_result(None)
+    
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "global_limit": self.global_limit,
+            "guild_limit": self.guild_limit,
+            "depth": len(self._queue),
+            "queue_size": self.queue_size,
+            "max_depth": self.max_depth,
+            "service_time": self.service_time,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+
+def render_busy_embed(retry_after: float) -> disnake.Embed:
+    """Ответ на команду, не допущенную из-за перегрузки"""
+    return disnake.Embed(
+        title="🚦 Бот перегружен",
+        description=f"Сейчас выполняется слишком много проверок. Попробуйте через {int(retry_after) + 1} сек.",
+        color=0xFFA500
+    )
+
+
+class CacheEntry:
+    """Запись кэша профилей"""
+    
+    __slots__ = ("record", "stored_at", "ttl")
+    
+    def __init__(self, record: "ProfileRecord", stored_at: float, ttl: float):
+        self.record = record
+        self.stored_at = stored_at
+        self.ttl = ttl
+
+
+class ProfileCache:
+    """LRU-кэш профилей с TTL и stale-while-revalidate
+    
+    Записи хранятся по steamid64. Свежая запись отдаётся как есть, устаревшая
+    (в пределах stale_ttl после истечения TTL) тоже отдаётся сразу, но
+    вызывающий должен обновить её в фоне. on_evict(steamid) вызывается, когда
+    данные записи больше не актуальны: при замене, вытеснении или истечении.
+    """
+    
+    FRESH = "fresh"
+    STALE = "stale"
+    
+    def __init__(
+        self,
+        max_size: int = PROFILE_CACHE_SIZE,
+        ttl: float = PROFILE_CACHE_TTL,
+        max_ttl: float = PROFILE_CACHE_MAX_TTL,
+        stale_ttl: float = PROFILE_CACHE_STALE_TTL,
+        on_evict=None,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_ttl = max_ttl
+        self.stale_ttl = stale_ttl
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def entry_ttl(self, record: ProfileRecord) -> float:
+        """TTL записи с учётом since_last_update
+        
+        Если ruststats.io давно не обновлял профиль, статистика игрока почти
+        не меняется, поэтому такие записи живут дольше (но не больше max_ttl).
+        """
+        upstream_age = parse_duration(record.since_last_update)
+        if not upstream_age:
+            return self.ttl
+        return min(max(self.ttl, upstream_age / 2), self.max_ttl)
+    
+    def get(self, steamid: str) -> Tuple[Optional[ProfileRecord], Optional[str]]:
+        """Вернуть (профиль, состояние) или (None, None) при промахе"""
+        entry = self._entries.get(steamid)
+        if entry is None:
+            self.misses += 1
+            return None, None
+        
+        age = time.monotonic() - entry.stored_at
+        if age <= entry.ttl:
+            state = self.FRESH
+            self.hits += 1
+        elif age <= entry.ttl + self.stale_ttl:
+            state = self.STALE
+            self.stale_hits += 1
+        else:
+            # Запись больше не отдаётся — удаляем, иначе on_evict повторялся бы на каждом get
+            self.misses += 1
+            del self._entries[steamid]
+            self._evicted(steamid)
+            return None, None
+        
+        self._entries.move_to_end(steamid)
+        return entry.record, state
+    
+    def peek(self, steamid: str) -> Optional[CacheEntry]:
+        """Запись профиля без учёта свежести и без изменения счётчиков"""
+        return self._entries.get(steamid)
+    
+    def put(self, steamid: str, record: ProfileRecord, fetched_at: float = None):
+        """Сохранить профиль
+        
+        fetched_at — время получения (time.time()) для записей, загруженных с диска.
+        """
+        previous = self._entries.get(steamid)
+        if previous is not None and previous.record.version != record.version:
+            self._evicted(steamid)
+        
+        stored_at = time.monotonic()
+        if fetched_at is not None:
+            stored_at -= max(0.0, time.time() - fetched_at)
+        self._entries[steamid] = CacheEntry(record, stored_at, self.entry_ttl(record))
+        self._entries.move_to_end(steamid)
+        
+        while len(self._entries) > self.max_size:
+            evicted, _ = self._entries.popitem(last=False)
+            self.evictions += 1
+            self._evicted(evicted)
+    
+    def _evicted(self, steamid: str):
+        if self.on_evict is not None:
+            self.on_evict(steamid)
+    
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class ProfileStore:
+    """Хранилище последних ответов get_profile в SQLite (WAL)
+    
+    Все обращения к базе идут через один рабочий поток, чтобы не блокировать
+    event loop. Запись буферизуется и сбрасывается пачками раз в flush_interval.
+    """
+    
+    def __init__(
+        self,
+        path: str = PROFILE_STORE_PATH,
+        flush_interval: float = PROFILE_STORE_FLUSH_INTERVAL,
+        keep_all_days: float = SNAPSHOT_KEEP_ALL_DAYS,
+        retention_days: Optional[float] = SNAPSHOT_RETENTION_DAYS,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.keep_all_days = keep_all_days
+        self.retention_days = retention_days
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ruststats-store")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pending: dict = {}
+        self._pending_snapshots: list = []
+        self._flush_task: Optional[asyncio.Task] = None
+        
+        self.reads = 0
+        self.hits = 0
+        self.writes = 0
+        self.snapshots_written = 0
+        self.snapshots_thinned = 0
+        self.thinned_at: Optional[float] = None
+        self.warmed = 0
+    
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+    
+    async def open(self):
+        await self._run(self._open)
+    
+    def _open(self):
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS profiles ("
+            "steamid TEXT PRIMARY KEY, body BLOB NOT NULL, fetched_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            "steamid TEXT NOT NULL, taken_at REAL NOT NULL, layout INTEGER NOT NULL, stats BLOB NOT NULL, "
+            "PRIMARY KEY (steamid, taken_at)) WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS links ("
+            "guild_id INTEGER NOT NULL, user_id INTEGER NOT NULL, steamid TEXT NOT NULL, "
+            "PRIMARY KEY (guild_id, user_id))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS watches ("
+            "guild_id INTEGER NOT NULL, steamid TEXT NOT NULL, PRIMARY KEY (guild_id, steamid))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS watch_channels (guild_id INTEGER PRIMARY KEY, channel_id INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+    
+    def put(self, steamid: str, body: bytes):
+        """Поставить ответ API в очередь на запись"""
+        self._pending[steamid] = (body, time.time())
+        self._schedule_flush()
+    
+    def add_snapshot(self, steamid: str, stats: bytes):
+        """Поставить снимок статистики в очередь; повтор последнего снимка не сохраняется"""
+        self._pending_snapshots.append((steamid, time.time(), SNAPSHOT_LAYOUT, stats))
+        self._schedule_flush()
+    
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+    
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+    
+    async def flush(self):
+        if not self._pending and not self._pending_snapshots:
+            return
+        batch, self._pending = self._pending, {}
+        snapshots, self._pending_snapshots = self._pending_snapshots, []
+        try:
+            await self._run(self._write, batch, snapshots)
+        except sqlite3.Error as e:
+            log.warning("Не удалось записать профили в %s: %s", self.path, e)
+    
+    def _write(self, batch: dict, snapshots: list):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO profiles (steamid, body, fetched_at) VALUES (?, ?, ?)",
+            [(steamid, body, fetched_at) for steamid, (body, fetched_at) in batch.items()]
+        )
+        for steamid, taken_at, layout, stats in snapshots:
+            last = self._conn.execute(
+                "SELECT layout, stats FROM snapshots WHERE steamid = ? ORDER BY taken_at DESC LIMIT 1",
+                (steamid,)
+            ).fetchone()
+            if last is not None and last[0] == layout and last[1] == stats:
+                continue
+            self._conn.execute(
+                "INSERT OR REPLACE INTO snapshots (steamid, taken_at, layout, stats) VALUES (?, ?, ?, ?)",
+                (steamid, taken_at, layout, stats)
+            )
+            self.snapshots_written += 1
+        self._conn.commit()
+        self.writes += len(batch)
+    
+    async def get(self, steamid: str) -> Optional[Tuple[bytes, float]]:
+        """Последний сохранённый ответ (тело, время получения) или None"""
+        self.reads += 1
+        row = self._pending.get(steamid)
+        if row is None:
+            row = await self._run(self._get, steamid)
+        if row is not None:
+            self.hits += 1
+        return row
+    
+    def _get(self, steamid: str):
+        return self._conn.execute(
+            "SELECT body, fetched_at FROM profiles WHERE steamid = ?", (steamid,)
+        ).fetchone()
+    
+    async def get_many(self, steamids: list) -> dict:
+        """Сохранённые ответы {steamid: (тело, время получения)} одним запросом"""
+        rows = {steamid: self._pending[steamid] for steamid in steamids if steamid in self._pending}
+        missing = [steamid for steamid in steamids if steamid not in rows]
+        if missing:
+            rows.update(await self._run(self._get_many, missing))
+        return rows
+    
+    def _get_many(self, steamids: list) -> dict:
+        placeholders = ", ".join("?" * len(steamids))
+        return {
+            steamid: (body, fetched_at)
+            for steamid, body, fetched_at in self._conn.execute(
+                f"SELECT steamid, body, fetched_at FROM profiles WHERE steamid IN ({placeholders})", steamids
+            )
+        }
+    
+    async def snapshots(self, steamid: str, limit: int = 25) -> list:
+        """Снимки игрока с текущим набором полей: [(время, снимок)], от новых к старым"""
+        await self.flush()
+        return await self._run(self._snapshots, steamid, limit)
+    
+    def _snapshots(self, steamid: str, limit: int) -> list:
+        return self._conn.execute(
+            "SELECT taken_at, stats FROM snapshots WHERE steamid = ? AND layout = ? "
+            "ORDER BY taken_at DESC LIMIT ?",
+            (steamid, SNAPSHOT_LAYOUT, limit)
+        ).fetchall()
+    
+    async def thin_snapshots(self) -> int:
+        """Проредить историю по политике хранения; возвращает число удалённых снимков"""
+        await self.flush()
+        removed = await self._run(self._thin_snapshots, time.time())
+        self.snapshots_thinned += removed
+        self.thinned_at = time.time()
+        return removed
+    
+    def _thin_snapshots(self, now: float) -> int:
+        removed = 0
+        if self.retention_days:
+            removed += self._conn.execute(
+                "DELETE FROM snapshots WHERE taken_at < ?", (now - self.retention_days * 86400,)
+            ).rowcount
+        cutoff = now - self.keep_all_days * 86400
+        removed += self._conn.execute(
+            "DELETE FROM snapshots WHERE taken_at < ? AND (steamid, taken_at) NOT IN ("
+            "SELECT steamid, MAX(taken_at) FROM snapshots WHERE taken_at < ? "
+            "GROUP BY steamid, CAST(taken_at / 86400 AS INTEGER))",
+            (cutoff, cutoff)
+        ).rowcount
+        self._conn.commit()
+        return removed
+    
+    async def set_link(self, guild_id: int, user_id: int, steamid: Optional[str]):
+        """Сохранить (или удалить при steamid=None) привязку участника"""
+        await self._run(self._set_link, guild_id, user_id, steamid)
+    
+    def _set_link(self, guild_id: int, user_id: int, steamid: Optional[str]):
+        if steamid is None:
+            self._conn.execute("DELETE FROM links WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
+        else:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO links (guild_id, user_id, steamid) VALUES (?, ?, ?)",
+                (guild_id, user_id, steamid)
+            )
+        self._conn.commit()
+    
+    async def load_links(self) -> list:
+        """Все привязки [(гильдия, участник, steamid)]"""
+        return await self._run(self._load_links)
+    
+    def _load_links(self) -> list:
+        return self._conn.execute("SELECT guild_id, user_id, steamid FROM links").fetchall()
+    
+    async def set_watch(self, guild_id: int, steamid: str, watched: bool):
+        """Добавить или убрать игрока из списка отслеживания гильдии"""
+        await self._run(self._set_watch, guild_id, steamid, watched)
+    
+    def _set_watch(self, guild_id: int, steamid: str, watched: bool):
+        if watched:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO watches (guild_id, steamid) VALUES (?, ?)", (guild_id, steamid)
+            )
+        else:
+            self._conn.execute("DELETE FROM watches WHERE guild_id = ? AND steamid = ?", (guild_id, steamid))
+        self._conn.commit()
+    
+    async def set_watch_channel(self, guild_id: int, channel_id: int):
+        await self._run(self._set_watch_channel, guild_id, channel_id)
+    
+    def _set_watch_channel(self, guild_id: int, channel_id: int):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO watch_channels (guild_id, channel_id) VALUES (?, ?)", (guild_id, channel_id)
+        )
+        self._conn.commit()
+    
+    async def load_watches(self) -> Tuple[list, list]:
+        """([(гильдия, steamid)], [(гильдия, канал оповещений)])"""
+        return await self._run(self._load_watches)
+    
+    def _load_watches(self) -> Tuple[list, list]:
+        return (
+            self._conn.execute("SELECT guild_id, steamid FROM watches").fetchall(),
+            self._conn.execute("SELECT guild_id, channel_id FROM watch_channels").fetchall(),
+        )
+    
+    async def load_recent(self, limit: int) -> list:
+        """Последние limit профилей (steamid, тело, время получения), от старых к новым"""
+        rows = await self._run(self._load_recent, limit)
+        self.warmed = len(rows)
+        return rows
+    
+    def _load_recent(self, limit: int) -> list:
+        rows = self._conn.execute(
+            "SELECT steamid, body, fetched_at FROM profiles ORDER BY fetched_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        rows.reverse()
+        return rows
+    
+    async def load_latest_snapshots(self) -> list:
+        """Последний снимок каждого игрока с текущим набором полей: [(steamid, значения)]"""
+        return await self._run(self._load_latest_snapshots)
+    
+    def _load_latest_snapshots(self) -> list:
+        # Голые столбцы при MAX() в SQLite берутся из строки с максимумом
+        rows = self._conn.execute(
+            "SELECT steamid, stats, MAX(taken_at) FROM snapshots WHERE layout = ? GROUP BY steamid",
+            (SNAPSHOT_LAYOUT,)
+        ).fetchall()
+        return [(steamid, unpack_snapshot(stats)) for steamid, stats, _ in rows]
+    
+    async def stats(self) -> dict:
+        rows, snapshots = await self._run(self._count)
+        size = 0
+        for suffix in ("", "-wal"):
+            try:
+                size += os.path.getsize(self.path + suffix)
+            except OSError:
+                pass
+        return {
+            "rows": rows,
+            "snapshots": snapshots,
+            "bytes": size,
+            "pending": len(self._pending),
+            "reads": self.reads,
+            "hits": self.hits,
+            "writes": self.writes,
+            "warmed": self.warmed,
+            "thinned": self.snapshots_thinned,
+            "thinned_at": self.thinned_at,
+        }
+    
+    def _count(self) -> Tuple[int, int]:
+        profiles = self._conn.execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+        snapshots = self._conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0]
+        return profiles, snapshots
+    
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        await self.flush()
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+
+class EmbedCache:
+    """Общий для всех StatsView кэш готовых embed
+    
+    Ключ — (steamid, версия данных, страница); страница рендерится при первом
+    обращении, дальше переключение страниц сводится к поиску в словаре.
+    """
+    
+    def __init__(self, max_size: int = EMBED_CACHE_SIZE):
+        self.max_size = max_size
+        self._embeds: "OrderedDict[tuple, disnake.Embed]" = OrderedDict()
+        self._by_steamid: dict = {}
+        
+        self.hits = 0
+        self.misses = 0
+    
+    def __len__(self) -> int:
+        return len(self._embeds)
+    
+    def get(self, steamid: str, version: int, page: str, record: ProfileRecord) -> disnake.Embed:
+        key = (steamid, version, page)
+        embed = self._embeds.get(key)
+        if embed is not None:
+            self.hits += 1
+            self._embeds.move_to_end(key)
+            return embed
+        
+        self.misses += 1
+        embed = render_page(record, page)
+        self._embeds[key] = embed
+        self._by_steamid.setdefault(steamid, set()).add(key)
+        
+        while len(self._embeds) > self.max_size:
+            old_key, _ = self._embeds.popitem(last=False)
+            self._forget(old_key)
+        return embed
+    
+    def discard(self, steamid: str):
+        """Удалить все страницы профиля"""
+        for key in self._by_steamid.pop(steamid, ()):
+            self._embeds.pop(key, None)
+    
+    def _forget(self, key: tuple):
+        keys = self._by_steamid.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_steamid[key[0]]
+    
+    def stats(self) -> dict:
+        return {
+            "size": len(self._embeds),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class SingleFlight:
+    """Объединение одновременных запросов с одинаковым ключом
+    
+    Первый вызов запускает задачу, остальные ждут её же результат или ошибку.
+    """
+    
+    def __init__(self):
+        self._calls: dict = {}
+        self.calls = 0
+        self.saved = 0
+    
+    def __contains__(self, key) -> bool:
+        return key in self._calls
+    
+    def __len__(self) -> int:
+        return len(self._calls)
+    
+    async def do(self, key, factory):
+        task = self._calls.get(key)
+        if task is not None:
+            self.saved += 1
+        else:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+            self.calls += 1
+        # shield: отмена одного ожидающего не отменяет общий запрос
+        return await asyncio.shield(task)
+    
+    def _done(self, key, task: asyncio.Future):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()
+    
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "saved": self.saved,
+        }
+
+
+class CardRenderer:
+    """PNG-карточки страниц профиля: рендер в пуле процессов и кэш на диске
+    
+    Имя файла — sha256 от (steamid, версия данных, страница, локаль, макет),
+    поэтому повторный показ и перелистывание той же версии профиля не рисуют
+    карточку заново, а новая версия профиля получает новые файлы.
+    """
+    
+    PRUNE_EVERY = 200
+    
+    def __init__(
+        self,
+        cache_dir: Optional[str] = CARD_CACHE_DIR,
+        workers: int = CARD_WORKERS,
+        locale: str = CARD_LOCALE,
+        max_files: int = CARD_CACHE_MAX_FILES,
+    ):
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.locale = locale
+        self.max_files = max_files
+        self.inflight = SingleFlight()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        
+        self.hits = 0
+        self.renders = 0
+        self.failures = 0
+    
+    @property
+    def available(self) -> bool:
+        return Image is not None and bool(self.cache_dir)
+    
+    def path_for(self, record: ProfileRecord, page: str) -> str:
+        key = f"{record.steamid}:{record.version}:{page}:{self.locale}:{CARD_LAYOUT}"
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.png")
+    
+    def cached(self, record: ProfileRecord, page: str) -> Optional[str]:
+        """Путь к уже нарисованной карточке или None"""
+        path = self.path_for(record, page)
+        try:
+            # Время изменения — отметка последнего показа: prune удаляет давно не нужные карточки
+            os.utime(path)
+        except OSError:
+            return None
+        self.hits += 1
+        return path
+    
+    async def render(self, record: ProfileRecord, page: str) -> str:
+        """Путь к PNG карточки, нарисовав её при необходимости"""
+        path = self.cached(record, page)
+        if path is not None:
+            return path
+        path = self.path_for(record, page)
+        return await self.inflight.do(path, lambda: self._render(path, card_content(record, page)))
+    
+    async def _render(self, path: str, content: tuple) -> str:
+        if self._pool is None:
+            method = CARD_START_METHOD
+            if method not in multiprocessing.get_all_start_methods():
+                method = "spawn"
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(method))
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._pool, draw_card, path, content)
+        except Exception:
+            self.failures += 1
+            raise
+        self.renders += 1
+        if self.renders % self.PRUNE_EVERY == 0:
+            loop.run_in_executor(None, self.prune)
+        return path
+    
+    def prune(self):
+        """Удалить дольше всех не показанные карточки сверх max_files (в потоке)"""
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith(".png"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    files.append((os.stat(path).st_mtime, path))
+                except OSError:
+                    # Файл удалён параллельно (другим prune или вручную)
+                    pass
+        if len(files) <= self.max_files:
+            return
+        files.sort()
+        for _, name in files[:len(files) - self.max_files * 9 // 10]:
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+    
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+    
+    def stats(self) -> dict:
+        return {
+            "available": self.available,
+            "hits": self.hits,
+            "renders": self.renders,
+            "failures": self.failures,
+            "rendering": len(self.inflight),
+        }
+
+
+class Histogram:
+    """Гистограмма задержек с фиксированными границами корзин, как в Prometheus"""
+    
+    __slots__ = ("buckets", "counts", "count", "sum")
+    
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+    
+    def merge(self, other: "Histogram"):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.sum += other.sum
+    
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля линейной интерполяцией внутри корзины (как histogram_quantile)"""
+        if not self.count:
+            return math.nan
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class Trace:
+    """Замеры стадий одной команды; исход проставляется всем стадиям в finish"""
+    
+    __slots__ = ("metrics", "command", "started", "stages", "_token")
+    
+    def __init__(self, metrics: "Metrics", command: str):
+        self.metrics = metrics
+        self.command = command
+        self.started = time.perf_counter()
+        self.stages: list = []
+        self._token = _current_trace.set(self)
+    
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - start))
+    
+    def finish(self, outcome: str):
+        _current_trace.reset(self._token)
+        for name, seconds in self.stages:
+            self.metrics.observe(self.command, name, outcome, seconds)
+        self.metrics.observe(self.command, "total", outcome, time.perf_counter() - self.started)
+        self.metrics.count(self.command, outcome)
+
+
+_current_trace: ContextVar = ContextVar("ruststats_trace", default=None)
+
+
+def trace_stage(name: str):
+    """Замер стадии текущей команды; вне команды (фоновое обновление) — ничего"""
+    trace = _current_trace.get()
+    return trace.stage(name) if trace is not None else nullcontext()
+
+
+def outcome_of(error: Exception) -> str:
+    """Метка исхода команды по исключению"""
+    if isinstance(error, ProfileNotFound):
+        return "404"
+    if isinstance(error, UpstreamError):
+        return "non200"
+    return "error"
+
+
+class Metrics:
+    """Гистограммы задержек по (команда, стадия, исход) и счётчики команд по исходу"""
+    
+    QUANTILES = (0.5, 0.95, 0.99)
+    
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.histograms: dict = {}
+        self.counters: dict = {}
+    
+    def trace(self, command: str) -> Trace:
+        return Trace(self, command)
+    
+    def observe(self, command: str, stage: str, outcome: str, seconds: float):
+        key = (command, stage, outcome)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        histogram.observe(seconds)
+    
+    def count(self, command: str, outcome: str):
+        key = (command, outcome)
+        self.counters[key] = self.counters.get(key, 0) + 1
+    
+    def stages(self, command: str) -> dict:
+        """{стадия: гистограмма} команды по всем исходам"""
+        merged = {}
+        for (name, stage, _), histogram in self.histograms.items():
+            if name != command:
+                continue
+            if stage not in merged:
+                merged[stage] = Histogram(self.buckets)
+            merged[stage].merge(histogram)
+        return merged
+    
+    def outcomes(self, command: str) -> dict:
+        return {outcome: count for (name, outcome), count in self.counters.items() if name == command}
+    
+    def commands(self) -> list:
+        return sorted({command for command, _ in self.counters})
+    
+    def render_prometheus(self) -> str:
+        """Текстовый формат экспозиции Prometheus"""
+        out = [
+            "# HELP ruststats_stage_seconds Latency of command stages",
+            "# TYPE ruststats_stage_seconds histogram",
+        ]
+        for (command, stage, outcome), histogram in sorted(self.histograms.items()):
+            labels = f'command="{command}",stage="{stage}",outcome="{outcome}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram.counts):
+                cumulative += count
+                out.append(f'ruststats_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            out.append(f'ruststats_stage_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            out.append(f"ruststats_stage_seconds_sum{{{labels}}} {histogram.sum}")
+            out.append(f"ruststats_stage_seconds_count{{{labels}}} {histogram.count}")
+        
+        out.append("# HELP ruststats_commands_total Commands handled by outcome")
+        out.append("# TYPE ruststats_commands_total counter")
+        for (command, outcome), count in sorted(self.counters.items()):
+            out.append(f'ruststats_commands_total{{command="{command}",outcome="{outcome}"}} {count}')
+        return "\n".join(out) + "\n"
+
+
+def _field_metric(path: str):
+    index = FIELD_INDEX[path]
+    
+    def metric(record: ProfileRecord) -> float:
+        return to_number(record.values[index])
+    return metric
+
+
+def _sum_metric(prefix: str):
+    indexes = tuple(index for path, index in FIELD_INDEX.items() if path.startswith(prefix))
+    
+    def metric(record: ProfileRecord) -> float:
+        total = 0.0
+        for index in indexes:
+            value = to_number(record.values[index])
+            if value == value:
+                total += value
+        return total
+    return metric
+
+
+# Метрики таблицы лидеров: ключ -> (название, функция значения)
+LEADERBOARD_METRICS = {
+    "kdr": ("⚔️ K/D Ratio", _field_metric("pvp_stats.kdr")),
+    "kills": ("💀 Убийства", _field_metric("pvp_stats.kills")),
+    "hours": ("⏱️ Часов в игре", _field_metric("overview.time_played")),
+    "headshots": ("🎯 Хедшоты", _field_metric("pvp_stats.headshots")),
+    "fish": ("🎣 Рыбы поймано", _sum_metric("fishing.caught_")),
+    "scrap": ("🔩 Скрап", _field_metric("gathered.scrap")),
+    "building": ("🧱 Блоков установлено", _field_metric("building_blocks.placed")),
+}
+
+
+class SortedIndex:
+    """Индекс участников по убыванию значения метрики
+    
+    Обновление — бинарный поиск и вставка в список, top-K — срез за O(K).
+    """
+    
+    def __init__(self):
+        self._keys: list = []
+        self._values: dict = {}
+    
+    def __len__(self) -> int:
+        return len(self._keys)
+    
+    def update(self, member: int, value: float):
+        self.remove(member)
+        if value != value:
+            return
+        self._values[member] = value
+        bisect.insort(self._keys, (-value, member))
+    
+    def remove(self, member: int):
+        value = self._values.pop(member, None)
+        if value is None:
+            return
+        index = bisect.bisect_left(self._keys, (-value, member))
+        del self._keys[index]
+    
+    def top(self, offset: int, count: int) -> list:
+        """[(участник, значение)] с позиции offset"""
+        return [(member, -key) for key, member in self._keys[offset:offset + count]]
+
+
+class Leaderboard:
+    """Привязки Steam ID участников гильдий и инкрементальные индексы метрик
+    
+    Индексы обновляются при каждом получении профиля, поэтому запрос таблицы
+    не требует сортировки всех участников.
+    """
+    
+    def __init__(self):
+        self.links: dict = {}
+        self._members: dict = {}
+        self._indexes: dict = {}
+    
+    def members(self, guild_id: int) -> int:
+        return len(self.links.get(guild_id, ()))
+    
+    def linked(self, steamid: str) -> bool:
+        return steamid in self._members
+    
+    def link(self, guild_id: int, user_id: int, steamid: str, record: Optional[ProfileRecord] = None):
+        self.unlink(guild_id, user_id)
+        self.links.setdefault(guild_id, {})[user_id] = steamid
+        self._members.setdefault(steamid, set()).add((guild_id, user_id))
+        if record is not None:
+            self._update_member(guild_id, user_id, record)
+    
+    def unlink(self, guild_id: int, user_id: int) -> Optional[str]:
+        steamid = self.links.get(guild_id, {}).pop(user_id, None)
+        if steamid is None:
+            return None
+        
+        members = self._members.get(steamid)
+        if members is not None:
+            members.discard((guild_id, user_id))
+            if not members:
+                del self._members[steamid]
+        for metric in LEADERBOARD_METRICS:
+            index = self._indexes.get((guild_id, metric))
+            if index is not None:
+                index.remove(user_id)
+        return steamid
+    
+    def update(self, record: ProfileRecord):
+        """Обновить позиции всех участников, привязавших этот профиль"""
+        for guild_id, user_id in self._members.get(record.steamid, ()):
+            self._update_member(guild_id, user_id, record)
+    
+    def _update_member(self, guild_id: int, user_id: int, record: ProfileRecord):
+        for metric, (_, value_of) in LEADERBOARD_METRICS.items():
+            index = self._indexes.get((guild_id, metric))
+            if index is None:
+                index = self._indexes[(guild_id, metric)] = SortedIndex()
+            index.update(user_id, value_of(record))
+    
+    def top(self, guild_id: int, metric: str, offset: int, count: int) -> list:
+        index = self._indexes.get((guild_id, metric))
+        return index.top(offset, count) if index is not None else []
+    
+    def ranked(self, guild_id: int, metric: str) -> int:
+        index = self._indexes.get((guild_id, metric))
+        return len(index) if index is not None else 0
+
+
+class PopulationMatrix:
+    """Столбцовая матрица числовой статистики всех известных профилей для перцентилей
+    
+    Строка — игрок, столбец — поле SNAPSHOT_FIELDS. С numpy отсортированные
+    столбцы пересобираются в потоке, не чаще раза в rebuild_interval (или
+    сразу, если запрошен игрок, изменившийся после сборки), в один массив
+    комплексных ключей "номер столбца + 1j * значение": numpy сравнивает
+    комплексные числа лексикографически, поэтому один searchsorted находит
+    ранги всех полей всех сравниваемых игроков сразу и без потери точности.
+    Без numpy столбцы — отсортированные списки, обновляемые через bisect.
+    """
+    
+    def __init__(self, rebuild_interval: float = PERCENTILE_REBUILD_INTERVAL):
+        self.rebuild_interval = rebuild_interval
+        self._rows: dict = {}
+        self.rebuilds = 0
+        if np is not None:
+            self._data = np.full((1024, len(SNAPSHOT_FIELDS)), np.nan)
+            self._keys = None
+            self._starts = None
+            self._counts = None
+            self._built_at = 0.0
+            self._dirty = False
+            self._changed: set = set()
+            self._building: Optional[asyncio.Future] = None
+        else:
+            self._columns = [[] for _ in SNAPSHOT_FIELDS]
+    
+    def __len__(self) -> int:
+        return len(self._rows)
+    
+    def update(self, steamid: str, values: array):
+        if np is not None:
+            row = self._rows.get(steamid)
+            if row is None:
+                row = self._rows[steamid] = len(self._rows)
+                if row == len(self._data):
+                    grown = np.full((len(self._data) * 2, self._data.shape[1]), np.nan)
+                    grown[:row] = self._data
+                    self._data = grown
+            self._data[row] = np.frombuffer(values, dtype=np.float64)
+            self._dirty = True
+            self._changed.add(steamid)
+            return
+        
+        old = self._rows.get(steamid)
+        self._rows[steamid] = values
+        for column, value in zip(self._columns, values):
+            if value == value:
+                bisect.insort(column, value)
+        if old is not None:
+            for column, value in zip(self._columns, old):
+                if value == value:
+                    del column[bisect.bisect_left(column, value)]
+    
+    @staticmethod
+    def _build_keys(data) -> tuple:
+        """(ключи, начала столбцов, число значений в столбцах) — выполняется в потоке"""
+        # Столбцы подряд, внутри столбца по возрастанию; NaN (нет данных) не входят
+        columns = np.sort(data, axis=0).T
+        present = ~np.isnan(columns)
+        counts = np.count_nonzero(present, axis=1)
+        starts = np.cumsum(counts) - counts
+        keys = np.repeat(np.arange(len(counts)), counts) + 1j * columns[present]
+        return keys, starts, counts
+    
+    def _outdated(self, steamids: tuple) -> bool:
+        if self._keys is None or any(steamid in self._changed for steamid in steamids):
+            return True
+        return self._dirty and time.monotonic() - self._built_at >= self.rebuild_interval
+    
+    async def _rebuild(self):
+        try:
+            # Копия на event loop: update() может менять строки, пока поток сортирует
+            data = self._data[:len(self._rows)].copy()
+            self._changed.clear()
+            self._dirty = False
+            keys, starts, counts = await asyncio.get_running_loop().run_in_executor(None, self._build_keys, data)
+            self._keys, self._starts, self._counts = keys, starts, counts
+            self._built_at = time.monotonic()
+            self.rebuilds += 1
+        finally:
+            self._building = None
+    
+    async def _sorted_keys(self, steamids: tuple) -> tuple:
+        # Уже идущая сборка могла начаться до изменения запрошенных игроков — тогда ещё одна
+        for _ in range(2):
+            if not self._outdated(steamids):
+                break
+            if self._building is None:
+                self._building = asyncio.ensure_future(self._rebuild())
+            await asyncio.shield(self._building)
+        return self._keys, self._starts, self._counts
+    
+    async def percentiles(self, vectors: list, steamids: tuple = ()) -> list:
+        """Перцентиль (0–100) каждого поля каждого вектора среди всех профилей; NaN — нет данных
+        
+        steamids — игроки, чьи векторы сравниваются: если они изменились после
+        последней сборки, выборка пересобирается до ответа.
+        """
+        if np is not None:
+            queries = np.array([np.frombuffer(vector, dtype=np.float64) for vector in vectors])
+            result = np.full(queries.shape, np.nan)
+            if not self._rows:
+                return result.tolist()
+            keys, starts, counts = await self._sorted_keys(steamids)
+            wanted = np.arange(queries.shape[1]) + 1j * queries
+            below = np.searchsorted(keys, wanted, side="left") - starts
+            not_above = np.searchsorted(keys, wanted, side="right") - starts
+            with np.errstate(divide="ignore", invalid="ignore"):
+                result = (below + not_above) * 50.0 / counts
+            result[:, counts == 0] = np.nan
+            result[np.isnan(queries)] = np.nan
+            return result.tolist()
+        
+        result = []
+        for vector in vectors:
+            ranks = []
+            for column, value in zip(self._columns, vector):
+                if value != value or not column:
+                    ranks.append(math.nan)
+                else:
+                    below = bisect.bisect_left(column, value)
+                    ranks.append((below + bisect.bisect_right(column, value)) * 50.0 / len(column))
+            result.append(ranks)
+        return result
+    
+    def stats(self) -> dict:
+        return {
+            "profiles": len(self._rows),
+            "backend": "numpy" if np is not None else "bisect",
+            "rebuilds": self.rebuilds,
+        }
+
+
+class WatchState:
+    """Расписание и последнее известное состояние отслеживаемого игрока"""
+    
+    __slots__ = ("interval", "due_at", "values", "is_banned")
+    
+    def __init__(self, interval: float, due_at: float):
+        self.interval = interval
+        self.due_at = due_at
+        self.values: Optional[array] = None
+        self.is_banned: Optional[bool] = None
+
+
+class Watchlist:
+    """Отслеживаемые игроки гильдий и расписание их опроса
+    
+    Очередь — куча (время опроса, steamid) с ленивым удалением устаревших
+    элементов. Интервал игрока подстраивается под частоту изменений его
+    статистики: после изменения он сокращается вдвое, без изменений растёт в
+    backoff раз, оставаясь в пределах [min_interval, max_interval].
+    """
+    
+    KEY_INDEXES = tuple(SNAPSHOT_FIELDS.index(path) for path in WATCH_KEY_FIELDS)
+    
+    def __init__(
+        self,
+        min_interval: float = WATCH_MIN_INTERVAL,
+        max_interval: float = WATCH_MAX_INTERVAL,
+        backoff: float = WATCH_BACKOFF,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.guilds: dict = {}
+        self.channels: dict = {}
+        self._watchers: dict = {}
+        self._states: dict = {}
+        self._queue: list = []
+        
+        self.polls = 0
+        self.changes = 0
+        self.alerts = 0
+    
+    def __len__(self) -> int:
+        return len(self._states)
+    
+    def watch(self, guild_id: int, steamid: str, record: Optional[ProfileRecord] = None) -> bool:
+        """Начать отслеживание; False, если игрок уже в списке гильдии"""
+        watched = self.guilds.setdefault(guild_id, set())
+        if steamid in watched:
+            return False
+        watched.add(steamid)
+        self._watchers.setdefault(steamid, set()).add(guild_id)
+        if steamid not in self._states:
+            state = self._states[steamid] = WatchState(self.min_interval, time.monotonic() + self.min_interval)
+            if record is not None:
+                state.values = snapshot_values(record)
+                state.is_banned = record.is_banned
+            heapq.heappush(self._queue, (state.due_at, steamid))
+        return True
+    
+    def unwatch(self, guild_id: int, steamid: str) -> bool:
+        watched = self.guilds.get(guild_id)
+        if not watched or steamid not in watched:
+            return False
+        watched.discard(steamid)
+        watchers = self._watchers[steamid]
+        watchers.discard(guild_id)
+        if not watchers:
+            del self._watchers[steamid]
+            del self._states[steamid]
+        return True
+    
+    def watchers(self, steamid: str) -> set:
+        return self._watchers.get(steamid, set())
+    
+    def state(self, steamid: str) -> Optional[WatchState]:
+        return self._states.get(steamid)
+    
+    def _valid(self, item: tuple) -> bool:
+        state = self._states.get(item[1])
+        return state is not None and state.due_at == item[0]
+    
+    def next_due(self) -> Optional[float]:
+        while self._queue and not self._valid(self._queue[0]):
+            heapq.heappop(self._queue)
+        return self._queue[0][0] if self._queue else None
+    
+    def pop_due(self, now: float, limit: int) -> list:
+        """До limit игроков, которым пора на опрос, начиная с самых просроченных"""
+        due = []
+        while len(due) < limit and self.next_due() is not None and self._queue[0][0] <= now:
+            due.append(heapq.heappop(self._queue)[1])
+        return due
+    
+    def _schedule(self, steamid: str, state: WatchState, now: float):
+        state.due_at = now + state.interval
+        heapq.heappush(self._queue, (state.due_at, steamid))
+    
+    def postpone(self, steamid: str, now: float):
+        """Опрос не удался: повторить через текущий интервал"""
+        state = self._states.get(steamid)
+        if state is not None:
+            self._schedule(steamid, state, now)
+    
+    def observe(self, steamid: str, record: ProfileRecord, now: float) -> list:
+        """Учесть свежий профиль: подстроить интервал и вернуть строки оповещения"""
+        state = self._states.get(steamid)
+        if state is None:
+            return []
+        self.polls += 1
+        values = snapshot_values(record)
+        
+        lines = []
+        if state.is_banned is not None and record.is_banned != state.is_banned:
+            lines.append(f"🔨 Бан: {'да' if state.is_banned else 'нет'} → **{'да' if record.is_banned else 'нет'}**")
+        stats_changed = state.values is not None and values.tobytes() != state.values.tobytes()
+        if stats_changed:
+            for index in self.KEY_INDEXES:
+                old, new = state.values[index], values[index]
+                if old == old and new == new and old != new:
+                    sign = "+" if new > old else ""
+                    lines.append(
+                        f"{FIELD_LABELS[SNAPSHOT_FIELDS[index]]}: {format_number(old)} → "
+                        f"**{format_number(new)}** ({sign}{format_number(new - old)})"
+                    )
+        if stats_changed or lines:
+            self.changes += 1
+            state.interval = max(self.min_interval, state.interval / 2)
+        else:
+            state.interval = min(self.max_interval, state.interval * self.backoff)
+        
+        state.values = values
+        state.is_banned = record.is_banned
+        self._schedule(steamid, state, now)
+        if lines:
+            self.alerts += 1
+        return lines
+    
+    def stats(self) -> dict:
+        now = time.monotonic()
+        intervals = [state.interval for state in self._states.values()]
+        return {
+            "players": len(self._states),
+            "guilds": sum(1 for watched in self.guilds.values() if watched),
+            "overdue": sum(1 for state in self._states.values() if state.due_at <= now),
+            "avg_interval": sum(intervals) / len(intervals) if intervals else 0.0,
+            "polls": self.polls,
+            "changes": self.changes,
+            "alerts": self.alerts,
+        }
+
+
+class PlayerIndex:
+    """Префиксный индекс уже полученных игроков для автодополнения
+    
+    Ключи (ник, vanity-имя и steamid64 в нижнем регистре) лежат в отсортированном
+    списке, поиск по префиксу — bisect и короткий проход вперёд. Подсказки
+    ранжируются по числу просмотров профиля, затем по времени последнего.
+    """
+    
+    def __init__(self, max_size: int = AUTOCOMPLETE_INDEX_SIZE):
+        self.max_size = max_size
+        self._keys: list = []
+        self._players: dict = {}
+        self._rank: dict = {}
+        
+        self.queries = 0
+    
+    def __len__(self) -> int:
+        return len(self._players)
+    
+    def add(self, record: ProfileRecord):
+        """Добавить профиль или обновить его ключи, если сменился ник"""
+        steamid = record.steamid
+        if not steamid:
+            return
+        
+        name = record.personaname or steamid
+        keys = tuple(dict.fromkeys(key for key in (name.lower(), record.vanity, steamid) if key))
+        current = self._players.get(steamid)
+        if current == (name, keys):
+            return
+        if current is not None:
+            self._remove_keys(steamid, current[1])
+        
+        self._players[steamid] = (name, keys)
+        self._rank.setdefault(steamid, (0, 0.0))
+        for key in keys:
+            bisect.insort(self._keys, (key, steamid))
+        if len(self._players) > self.max_size:
+            self._trim()
+    
+    def hit(self, steamid: str):
+        """Учесть просмотр профиля через /check account"""
+        rank = self._rank.get(steamid)
+        if rank is not None:
+            self._rank[steamid] = (rank[0] + 1, time.time())
+    
+    def discard(self, steamid: str):
+        current = self._players.pop(steamid, None)
+        if current is not None:
+            self._remove_keys(steamid, current[1])
+            del self._rank[steamid]
+    
+    def _remove_keys(self, steamid: str, keys: tuple):
+        for key in keys:
+            index = bisect.bisect_left(self._keys, (key, steamid))
+            if index < len(self._keys) and self._keys[index] == (key, steamid):
+                del self._keys[index]
+    
+    def _trim(self):
+        """Вытеснить десятую часть самых редко просматриваемых игроков"""
+        count = len(self._players) - self.max_size + max(1, self.max_size // 10)
+        for steamid in heapq.nsmallest(count, self._rank, key=self._rank.__getitem__):
+            self.discard(steamid)
+    
+    def suggest(self, text: str, limit: int = AUTOCOMPLETE_CHOICES) -> list:
+        """[(ник, steamid64)] по префиксу ввода, самые просматриваемые первыми"""
+        self.queries += 1
+        prefix = text.strip().lower()
+        if not prefix:
+            candidates = self._rank
+        else:
+            candidates = {}
+            index = bisect.bisect_left(self._keys, (prefix,))
+            end = min(len(self._keys), index + AUTOCOMPLETE_SCAN_LIMIT)
+            while index < end and self._keys[index][0].startswith(prefix):
+                steamid = self._keys[index][1]
+                candidates[steamid] = self._rank[steamid]
+                index += 1
+        
+        ranked = heapq.nlargest(limit, candidates, key=candidates.__getitem__)
+        return [(self._players[steamid][0], steamid) for steamid in ranked]
+    
+    def stats(self) -> dict:
+        return {
+            "players": len(self._players),
+            "keys": len(self._keys),
+            "max_size": self.max_size,
+            "queries": self.queries,
+        }
+
+
+# Колонки экспорта: сведения об игроке, затем статистика в порядке страниц StatsView
+EXPORT_BASE_COLUMNS = ("steamid", "discord_user_ids", "personaname", "is_private", "is_banned", "since_last_update")
+def _export_columns() -> tuple:
+    """Заголовки колонок статистики "Страница: подпись"; повторы уточняются разделом ответа API"""
+    page_labels = {page["key"]: page["label"] for page in PAGES}
+    names = [
+        f"{page_labels[FIELD_PAGE[path]]}: {_CARD_MARKUP.sub('', FIELD_LABELS[path]).strip()}"
+        for path in STAT_FIELDS
+    ]
+    repeated = {name for name in names if names.count(name) > 1}
+    return tuple(
+        f"{name} ({path.split('.', 1)[0]})" if name in repeated else name
+        for name, path in zip(names, STAT_FIELDS)
+    )
+
+
+EXPORT_STAT_COLUMNS = _export_columns()
+
+
+def export_row(steamid: str, user_ids: list, record: Optional[ProfileRecord]) -> tuple:
+    """Строка экспорта; у игрока без сохранённого профиля заполнены только steamid и участники"""
+    users = " ".join(str(user_id) for user_id in user_ids)
+    if record is None:
+        return (steamid, users) + (None,) * (len(EXPORT_BASE_COLUMNS) - 2 + len(STAT_FIELDS))
+    return (
+        steamid, users, record.personaname, record.is_private, record.is_banned, record.since_last_update,
+    ) + record.values
+
+
+class ExportWriter:
+    """Файл экспорта, дописываемый порциями строк; методы блокирующие, вызываются из потока
+    
+    В CSV значения статистики пишутся как в ответе API. В Parquet колонки
+    статистики числовые (to_number: длительности в часах, проценты без знака).
+    """
+    
+    def __init__(self, path: str, fmt: str):
+        self.fmt = fmt
+        self._file = None
+        self._parquet = None
+        if fmt == "parquet":
+            self._schema = pa.schema(
+                [(name, pa.bool_() if name.startswith("is_") else pa.string()) for name in EXPORT_BASE_COLUMNS]
+                + [(name, pa.float64()) for name in EXPORT_STAT_COLUMNS]
+            )
+            self._parquet = pq.ParquetWriter(path, self._schema)
+        else:
+            # utf-8-sig, чтобы Excel узнал кодировку
+            self._file = open(path, "w", encoding="utf-8-sig", newline="")
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(EXPORT_BASE_COLUMNS + EXPORT_STAT_COLUMNS)
+    
+    def write(self, rows: list):
+        if self._parquet is None:
+            self._csv.writerows(rows)
+            return
+        
+        base = len(EXPORT_BASE_COLUMNS)
+        columns = list(zip(*rows))
+        arrays = []
+        for index, (column, field) in enumerate(zip(columns, self._schema)):
+            if index >= base:
+                column = [None if value is None else to_number(value) for value in column]
+            elif pa.types.is_string(field.type):
+                # normalize_value превращает числовые строки (например, since_last_update) в числа
+                column = [None if value is None else str(value) for value in column]
+            arrays.append(pa.array(column, type=field.type))
+        self._parquet.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+    
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+        if self._file is not None:
+            self._file.close()
+
+
+class RustStats(commands.Cog):
+    
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.api_url = "https://ruststats.io/api/rpc/get_profile"
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.embed_cache = EmbedCache()
+        self.cards = CardRenderer()
+        self.profile_cache = ProfileCache(on_evict=self.embed_cache.discard)
+        self.inflight = SingleFlight()
+        self.resolver = SteamIdResolver()
+        self.players = PlayerIndex()
+        self.coordinator = CoordinatorClient(COORDINATOR_SOCKET) if COORDINATOR_SOCKET else None
+        self.limiter = SharedLimiter(self.coordinator, UpstreamLimiter()) if self.coordinator else UpstreamLimiter()
+        self.breaker = CircuitBreaker()
+        self.admission = AdmissionController()
+        self.store = ProfileStore() if PROFILE_STORE_PATH else None
+        self.leaderboard = Leaderboard()
+        self.population = PopulationMatrix()
+        self.watchlist = Watchlist()
+        self.views = ViewRegistry(bot)
+        self.metrics = Metrics()
+        self.metrics_runner: Optional[web.AppRunner] = None
+        self._background_tasks: set = set()
+    
+    async def cog_load(self):
+        """Создать общую HTTP-сессию и прогреть кэш из хранилища при загрузке кога"""
+        await self.get_session()
+        if METRICS_PORT:
+            await self.start_metrics_server()
+        if self.store is not None:
+            try:
+                await self.store.open()
+                await self.warm_cache()
+                await self.load_links()
+                await self.load_population()
+                await self.load_watches()
+            except sqlite3.Error as e:
+                log.error("Хранилище профилей %s недоступно: %s", self.store.path, e)
+                self.store = None
+            else:
+                self.start_background(self.snapshot_retention_loop())
+        self.start_background(self.watch_loop())
+    
+    async def snapshot_retention_loop(self):
+        """Раз в SNAPSHOT_THIN_INTERVAL прореживать историю снимков в хранилище"""
+        while self.store is not None:
+            try:
+                removed = await self.store.thin_snapshots()
+                if removed:
+                    log.info("Удалено снимков истории по политике хранения: %s", removed)
+            except sqlite3.Error as e:
+                log.warning("Не удалось проредить историю снимков: %s", e)
+            await asyncio.sleep(SNAPSHOT_THIN_INTERVAL)
+    
+    async def start_metrics_server(self):
+        """Поднять локальный HTTP-эндпоинт /metrics в формате Prometheus"""
+        async def handle(request: web.Request) -> web.Response:
+            return web.Response(text=self.metrics.render_prometheus(), content_type="text/plain", charset="utf-8")
+        
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+        except OSError as e:
+            log.error("Эндпоинт метрик %s:%s недоступен: %s", METRICS_HOST, METRICS_PORT, e)
+            await runner.cleanup()
+            return
+        self.metrics_runner = runner
+    
+    async def load_links(self):
+        """Загрузить привязки Steam ID и построить индексы таблицы лидеров"""
+        links = await self.store.load_links()
+        for start in range(0, len(links), EXPORT_CHUNK_SIZE):
+            chunk = links[start:start + EXPORT_CHUNK_SIZE]
+            records = await self.stored_records(list({steamid for _, _, steamid in chunk}))
+            for record in records.values():
+                self.players.add(record)
+            for guild_id, user_id, steamid in chunk:
+                self.leaderboard.link(guild_id, user_id, steamid, records.get(steamid))
+    
+    async def load_watches(self):
+        """Загрузить списки отслеживания; последние известные профили служат точкой отсчёта"""
+        watches, channels = await self.store.load_watches()
+        self.watchlist.channels.update(channels)
+        for guild_id, steamid in watches:
+            self.watchlist.watch(guild_id, steamid, await self.fallback_profile(steamid))
+    
+    async def load_population(self):
+        """Заполнить матрицу перцентилей последними снимками всех сохранённых игроков"""
+        for steamid, values in await self.store.load_latest_snapshots():
+            self.population.update(steamid, values)
+    
+    async def warm_cache(self):
+        """Заполнить кэш профилей последними ответами из хранилища"""
+        for steamid, body, fetched_at in await self.store.load_recent(self.profile_cache.max_size):
+            try:
+                record = parse_profile(body)
+            except ValueError:
+                continue
+            if record:
+                self.profile_cache.put(steamid, record, fetched_at=fetched_at)
+                self.players.add(record)
+                if record.vanity:
+                    self.resolver.learn(record.vanity, steamid)
+    
+    def cog_unload(self):
+        """Остановить фоновые задачи и закрыть HTTP-сессию при выгрузке кога"""
+        for task in self._background_tasks:
+            task.cancel()
+        self.views.clear()
+        self.limiter.close()
+        if self.coordinator is not None:
+            self.coordinator.close()
+        self.cards.close()
+        if self.session is not None and not self.session.closed:
+            asyncio.ensure_future(self.session.close())
+        self.session = None
+        if self.store is not None:
+            asyncio.ensure_future(self.store.close())
+        if self.metrics_runner is not None:
+            asyncio.ensure_future(self.metrics_runner.cleanup())
+            self.metrics_runner = None
+    
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Общая сессия с пулом keep-alive соединений"""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_POOL_LIMIT,
+                limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+                keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(
+                    total=HTTP_TIMEOUT_TOTAL,
+                    sock_connect=HTTP_TIMEOUT_CONNECT,
+                    sock_read=HTTP_TIMEOUT_READ,
+                ),
+                headers={"Content-Type": "application/json"},
+            )
+        return self.session
+    
+    def get_pool_stats(self) -> dict:
+        """Статистика пула соединений"""
+        if self.session is None or self.session.closed:
+            return {"open": False}
+        
+        connector = self.session.connector
+        acquired = getattr(connector, "_acquired", ())
+        idle = getattr(connector, "_conns", {})
+        return {
+            "open": True,
+            "limit": connector.limit,
+            "limit_per_host": connector.limit_per_host,
+            "in_use": len(acquired),
+            "idle": sum(len(conns) for conns in idle.values()),
+        }
+    
+    def has_stats_data(self, record: ProfileRecord) -> bool:
+        if not record:
+            return False
+        
+        time_played = record.get("overview.time_played")
+        kills = record.get("pvp_stats.kills")
+        
+        if time_played or kills:
+            return True
+        
+        return False
+    
+    async def fetch_profile(self, query: str, guild_id: Optional[int] = None) -> Optional[ProfileRecord]:
+        """Запросить и разобрать профиль, сохранив ответ в хранилище"""
+        body = await self.request_profile(query, guild_id)
+        with trace_stage("decode"):
+            record = parse_profile(body)
+        if record and record.steamid and self.store is not None:
+            self.store.put(record.steamid, body)
+            self.store.add_snapshot(record.steamid, pack_snapshot(record))
+        if record and record.steamid and self.coordinator is not None:
+            aliases = (f"vanity:{record.vanity}",) if record.vanity else ()
+            self.coordinator.put(record.steamid, body, time.time(), aliases)
+        return record
+    
+    async def shared_profile(self, key: str) -> Optional[ProfileRecord]:
+        """Свежий профиль, уже полученный другим шардом, или None"""
+        with trace_stage("shared"):
+            shared = await self.coordinator.get(key)
+        if shared is None:
+            return None
+        body, fetched_at = shared
+        try:
+            record = parse_profile(body)
+        except ValueError:
+            return None
+        # Устаревший ответ не годится: ради его обновления мы и пришли
+        if not record or time.time() - fetched_at > self.profile_cache.entry_ttl(record):
+            return None
+        return record
+    
+    async def request_profile(self, query: str, guild_id: Optional[int] = None) -> bytes:
+        """Запросить профиль у ruststats.io с учётом лимита запросов и circuit breaker"""
+        if not self.breaker.allow():
+            raise CircuitOpen()
+        
+        session = await self.get_session()
+        try:
+            for attempt in range(UPSTREAM_MAX_RETRIES + 1):
+                with trace_stage("queue"):
+                    await self.limiter.acquire(guild_id)
+                with trace_stage("upstream"):
+                    async with session.post(self.api_url, json={"id": query}) as response:
+                        if response.status == 429:
+                            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                            self.limiter.penalize(retry_after)
+                            if attempt < UPSTREAM_MAX_RETRIES and retry_after <= UPSTREAM_MAX_RETRY_AFTER:
+                                continue
+                            raise RateLimited(retry_after)
+                        if response.status == 404:
+                            raise ProfileNotFound(query)
+                        if response.status != 200:
+                            raise UpstreamError(response.status)
+                        body = await response.read()
+                        break
+        except (asyncio.TimeoutError, aiohttp.ClientError):
+            self.breaker.record_failure()
+            raise
+        except UpstreamError as e:
+            if e.status >= 500:
+                self.breaker.record_failure()
+            raise
+        except ProfileNotFound:
+            self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return body
+    
+    async def lookup(self, query: str, guild_id: Optional[int] = None) -> Tuple[Optional[ProfileRecord], bool]:
+        """Профиль для показа: (профиль, устаревший ли)
+        
+        Если ruststats.io недоступен, отдаётся последняя сохранённая копия
+        профиля независимо от её возраста.
+        """
+        try:
+            return await self.get_profile(query, guild_id), False
+        except (UpstreamError, CircuitOpen, asyncio.TimeoutError, aiohttp.ClientError):
+            record = await self.fallback_profile(query)
+            if record is None:
+                raise
+            return record, True
     
-    @disnake.ui.button(label="Убийства", style=disnake.ButtonStyle.secondary, emoji="💀", row=0)
-    async def kills_button(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
-        await self.switch_page(inter, "kills")
+    async def fallback_profile(self, query: str) -> Optional[ProfileRecord]:
+        """Последняя известная копия профиля из кэша или хранилища, даже если она истекла"""
+        steamid, _ = self.resolver.resolve(query)
+        if steamid is None:
+            return None
+        entry = self.profile_cache.peek(steamid)
+        if entry is not None:
+            return entry.record
+        
+        if self.store is None:
+            return None
+        row = await self.store.get(steamid)
+        if row is None:
+            return None
+        record = parse_profile(row[0])
+        if record:
+            self.profile_cache.put(steamid, record, fetched_at=row[1])
+            self.players.add(record)
+        return record
     
-    @disnake.ui.button(label="Бой", style=disnake.ButtonStyle.secondary, emoji="🔫", row=0)
-    async def combat_button(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
-        await self.switch_page(inter, "combat")
+    def resolve_query(self, query: str) -> Tuple[str, str, Optional[str]]:
+        """(ключ кэша, запрос к API, vanity-имя) для ввода пользователя
+        
+        Если steamid64 известен, он и ключ, и запрос. Иначе ключ строится по
+        нормализованному имени, а в API уходит исходный ввод.
+        """
+        steamid, name = self.resolver.resolve(query)
+        if steamid is not None:
+            return steamid, steamid, None
+        return f"vanity:{name}", query.strip(), name
     
-    @disnake.ui.button(label="Смерти", style=disnake.ButtonStyle.secondary, emoji="☠️", row=1)
-    async def deaths_button(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
-        await self.switch_page(inter, "deaths")
+    async def get_profile(self, query: str, guild_id: Optional[int] = None) -> Optional[ProfileRecord]:
+        """Профиль из кэша или из ruststats.io"""
+        key, upstream, name = self.resolve_query(query)
+        record, state = self.profile_cache.get(key)
+        if state == ProfileCache.STALE:
+            self.schedule_refresh(key)
+        if record is not None:
+            return record
+        
+        return await self.inflight.do(key, lambda: self._load_profile(upstream, guild_id, name))
     
-    @disnake.ui.button(label="Ресурсы", style=disnake.ButtonStyle.secondary, emoji="⛏️", row=1)
-    async def gathered_button(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
-        await self.switch_page(inter, "gathered")
+    async def _load_profile(
+        self, query: str, guild_id: Optional[int] = None, name: Optional[str] = None
+    ) -> Optional[ProfileRecord]:
+        """Запросить профиль и положить его в кэш (выполняется через SingleFlight)"""
+        record = None
+        if self.coordinator is not None:
+            record = await self.shared_profile(f"vanity:{name}" if name else query)
+        if record is None:
+            record = await self.fetch_profile(query, guild_id)
+        if record and record.steamid:
+            self.profile_cache.put(record.steamid, record)
+            if name:
+                self.resolver.learn(name, record.steamid)
+            if record.vanity:
+                self.resolver.learn(record.vanity, record.steamid)
+            self.profile_updated(record)
+        return record
     
-    @disnake.ui.button(label="Стройка", style=disnake.ButtonStyle.secondary, emoji="🏗️", row=1)
-    async def building_button(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
-        await self.switch_page(inter, "building")
+    def profile_updated(self, record: ProfileRecord):
+        """Обновить производные индексы после получения свежего профиля"""
+        self.players.add(record)
+        if record.steamid:
+            self.population.update(record.steamid, snapshot_values(record))
+        if record.steamid and self.leaderboard.linked(record.steamid):
+            self.leaderboard.update(record)
     
-    @disnake.ui.button(label="Среда", style=disnake.ButtonStyle.secondary, emoji="🌡️", row=2)
-    async def exposure_button(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
-        await self.switch_page(inter, "exposure")
+    def schedule_refresh(self, steamid: str):
+        """Обновить устаревшую запись кэша в фоне"""
+        if steamid in self.inflight:
+            return
+        
+        self.start_background(self._refresh(steamid))
     
-    @disnake.ui.button(label="Рыбалка", style=disnake.ButtonStyle.secondary, emoji="🎣", row=2)
-    async def fishing_button(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
-        await self.switch_page(inter, "fishing")
+    def start_background(self, coro):
+        """Запустить фоновую задачу, которая отменится при выгрузке кога"""
+        task = asyncio.ensure_future(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
     
-    @disnake.ui.button(label="Другое", style=disnake.ButtonStyle.secondary, emoji="📋", row=2)
-    async def other_button(self, button: disnake.ui.Button, inter: disnake.MessageInteraction):
-        await self.switch_page(inter, "other")
-
-
-class RustStats(commands.Cog):
+    async def _refresh(self, steamid: str):
+        # Фоновое обновление не входит в задержку команды, которая его запустила
+        _current_trace.set(None)
+        try:
+            await self.inflight.do(steamid, lambda: self._load_profile(steamid))
+        except CircuitOpen:
+            pass
+        except Exception as e:
+            log.warning("Не удалось обновить профиль %s: %s", steamid, e)
     
-    def __init__(self, bot: commands.Bot):
-        self.bot = bot
-        self.api_url = "https://ruststats.io/api/rpc/get_profile"
+    async def watch_loop(self):
+        """Планировщик опроса отслеживаемых игроков в пределах WATCH_BUDGET запросов в секунду"""
+        while True:
+            try:
+                now = time.monotonic()
+                due = self.watchlist.pop_due(now, WATCH_BATCH_SIZE)
+                if not due:
+                    next_due = self.watchlist.next_due()
+                    delay = WATCH_IDLE_SLEEP if next_due is None else min(WATCH_IDLE_SLEEP, next_due - now)
+                    await asyncio.sleep(max(delay, 0.1))
+                    continue
+                await asyncio.gather(*(self.poll_watched(steamid) for steamid in due))
+                # Пауза после пачки держит средний темп опроса в пределах бюджета
+                await asyncio.sleep(len(due) / WATCH_BUDGET)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Ошибка планировщика отслеживания")
+                await asyncio.sleep(WATCH_IDLE_SLEEP)
     
-    def has_stats_data(self, data: dict) -> bool:
-        if not data:
-            return False
-        
-        overview = data.get("overview", {})
-        pvp = data.get("pvp_stats", {})
+    async def poll_watched(self, steamid: str):
+        """Опросить игрока через общий путь загрузки; свежая запись кэша не тратит запрос"""
+        record, state = self.profile_cache.get(steamid)
+        try:
+            if state != ProfileCache.FRESH:
+                record = await self.inflight.do(steamid, lambda: self._load_profile(steamid, WATCH_LIMITER_KEY))
+        except Exception as e:
+            log.debug("Не удалось опросить отслеживаемого игрока %s: %s", steamid, e)
+            self.watchlist.postpone(steamid, time.monotonic())
+            return
+        if not record:
+            self.watchlist.postpone(steamid, time.monotonic())
+            return
         
-        time_played = overview.get("time_played")
-        kills = pvp.get("kills")
+        lines = self.watchlist.observe(steamid, record, time.monotonic())
+        if lines:
+            await self.send_watch_alert(record, lines)
+    
+    async def send_watch_alert(self, record: ProfileRecord, lines: list):
+        """Оповещение во все гильдии, отслеживающие игрока и указавшие канал"""
+        embed = render_base_embed(record)
+        embed.title = "👁️ Изменения у отслеживаемого игрока"
+        embed.description = "\n".join(lines)
+        for guild_id in list(self.watchlist.watchers(record.steamid)):
+            channel_id = self.watchlist.channels.get(guild_id)
+            if channel_id is None:
+                continue
+            try:
+                await self.bot.get_partial_messageable(channel_id).send(embed=embed)
+            except disnake.HTTPException as e:
+                log.warning("Не удалось отправить оповещение в канал %s: %s", channel_id, e)
+    
+    @commands.Cog.listener("on_button_click")
+    async def restore_view(self, inter: disnake.MessageInteraction):
+        """Восстановить StatsView после перезапуска по custom_id кнопки"""
+        await self._restore_view(inter)
+    
+    @commands.Cog.listener("on_dropdown")
+    async def restore_view_select(self, inter: disnake.MessageInteraction):
+        """Восстановить StatsView после перезапуска по custom_id выбора снимка"""
+        await self._restore_view(inter)
+    
+    async def _restore_view(self, inter: disnake.MessageInteraction):
+        parsed = parse_custom_id(inter.component.custom_id or "")
+        if parsed is None or inter.message.id in self.views:
+            return
         
-        if time_played or kills:
-            return True
+        steamid, page, author_id, card = parsed
+        view = StatsView(self, steamid, author_id, card=card and self.cards.available)
+        if not await view.interaction_check(inter):
+            return
         
-        return False
+        self.bot.add_view(view, message_id=inter.message.id)
+        self.views.add(inter.channel_id, inter.message.id, view)
+        if page == SNAPSHOT_SELECT_PAGE:
+            await view.select_snapshot(inter, float(inter.values[0]))
+        else:
+            await view.switch_page(inter, page)
     
     @commands.slash_command(name="check", description="Команды для проверки статистики")
     async def check(self, inter: disnake.ApplicationCommandInteraction):
@@ -530,51 +3933,44 @@ class RustStats(commands.Cog):
         steam_id: str = commands.Param(
             description="Steam ID, URL профиля или имя пользователя",
             name="steam"
+        ),
+        card: bool = commands.Param(
+            default=False,
+            description="Показать страницы картинкой"
         )
     ):
-        await inter.response.defer()
-        
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.api_url,
-                    json={"id": steam_id},
-                    headers={"Content-Type": "application/json"}
-                ) as response:
-                    
-                    if response.status == 404:
-                        embed = disnake.Embed(
-                            title="❌ Профиль не найден",
-                            description="Игрок с указанным Steam ID/URL не найден.\n\n"
-                                       "**Убедитесь, что:**\n"
-                                       "• Steam ID или URL введены правильно\n"
-                                       "• Игрок играл в Rust",
-                            color=0xFF0000
-                        )
-                        await inter.followup.send(embed=embed)
-                        return
-                    
-                    if response.status != 200:
-                        embed = disnake.Embed(
-                            title="❌ Ошибка API",
-                            description=f"Не удалось получить данные. Код ошибки: {response.status}",
-                            color=0xFF0000
-                        )
-                        await inter.followup.send(embed=embed)
-                        return
-                    
-                    data = await response.json()
+        trace = self.metrics.trace("account")
+        try:
+            ticket = self.admission.enter(inter.guild_id)
+        except AdmissionRejected as e:
+            # Отвечаем до defer: ждать в очереди дольше, чем живёт взаимодействие, бессмысленно
+            with trace.stage("send"):
+                await inter.response.send_message(embed=render_busy_embed(e.retry_after), ephemeral=True)
+            trace.finish("busy")
+            return
+        
+        query = steam_id.strip()
+        outcome = "error"
+        try:
+            with trace.stage("defer"):
+                await inter.response.defer()
+            with trace.stage("admission"):
+                await ticket.wait()
+            record, stale = await self.lookup(query, inter.guild_id)
             
-            if not data:
+            if not record:
+                outcome = "404"
                 embed = disnake.Embed(
                     title="❌ Данные не найдены",
                     description="Не удалось получить статистику для этого профиля.",
                     color=0xFF0000
                 )
-                await inter.followup.send(embed=embed)
+                with trace.stage("send"):
+                    await inter.followup.send(embed=embed)
                 return
             
-            if data.get("is_private", False) and not self.has_stats_data(data):
+            if record.is_private and not self.has_stats_data(record):
+                outcome = "private"
                 embed = disnake.Embed(
                     title="🔒 Приватный профиль",
                     description="Этот Steam профиль является приватным и данные отсутствуют в базе.\n\n"
@@ -583,32 +3979,106 @@ class RustStats(commands.Cog):
                                "• Или посетить [ruststats.io](https://ruststats.io) для индексации",
                     color=0xFFA500
                 )
-                embed.set_thumbnail(url=data.get("avatar_full_url", ""))
+                embed.set_thumbnail(url=record.avatar_full_url)
                 embed.add_field(
                     name="Игрок",
-                    value=data.get("personaname", "Unknown"),
+                    value=record.personaname,
                     inline=True
                 )
                 embed.add_field(
                     name="SteamID",
-                    value=data.get("steamid", "N/A"),
+                    value=record.steamid or "N/A",
                     inline=True
                 )
-                await inter.followup.send(embed=embed)
+                with trace.stage("send"):
+                    await inter.followup.send(embed=embed)
+                return
+            
+            content = "⚠️ ruststats.io сейчас недоступен — показаны сохранённые данные" if stale else None
+            if not record.steamid:
+                # Без steamid64 кнопкам не из чего собрать custom_id и нечего искать в кэше
+                with trace.stage("render"):
+                    embed = render_page(record, "overview")
+                with trace.stage("send"):
+                    await inter.followup.send(content=content, embed=embed)
+                outcome = "ok"
                 return
             
-            view = StatsView(data, inter.author.id)
-            embed = view.get_overview_embed()
+            self.players.hit(record.steamid)
+            with trace.stage("render"):
+                view = StatsView(self, record.steamid, inter.author.id, card=card and self.cards.available)
+                embed = await view.get_card_embed() if view.card else view.get_current_embed()
             
-            await inter.followup.send(embed=embed, view=view)
+            with trace.stage("send"):
+                message = await inter.followup.send(content=content, embed=embed, view=view)
+            self.views.add(message.channel.id, message.id, view)
+            outcome = "ok"
             
+        except AdmissionRejected as e:
+            # После публичного defer ephemeral уже не выйдет — заменяем «думает...» на ответ
+            outcome = "busy"
+            with trace.stage("send"):
+                await inter.edit_original_response(embed=render_busy_embed(e.retry_after))
+        
+        except ProfileNotFound:
+            outcome = "404"
+            embed = disnake.Embed(
+                title="❌ Профиль не найден",
+                description="Игрок с указанным Steam ID/URL не найден.\n\n"
+                           "**Убедитесь, что:**\n"
+                           "• Steam ID или URL введены правильно\n"
+                           "• Игрок играл в Rust",
+                color=0xFF0000
+            )
+            with trace.stage("send"):
+                await inter.followup.send(embed=embed)
+        
+        except RateLimited as e:
+            outcome = "non200"
+            embed = disnake.Embed(
+                title="⏳ Слишком много запросов",
+                description=f"ruststats.io ограничил частоту запросов. Попробуйте через {int(e.retry_after) + 1} сек.",
+                color=0xFFA500
+            )
+            with trace.stage("send"):
+                await inter.followup.send(embed=embed)
+        
+        except CircuitOpen:
+            embed = disnake.Embed(
+                title="🔌 API временно недоступно",
+                description="ruststats.io не отвечает. Попробуйте через минуту.",
+                color=0xFF0000
+            )
+            with trace.stage("send"):
+                await inter.followup.send(embed=embed)
+        
+        except UpstreamError as e:
+            outcome = "non200"
+            embed = disnake.Embed(
+                title="❌ Ошибка API",
+                description=f"Не удалось получить данные. Код ошибки: {e.status}",
+                color=0xFF0000
+            )
+            with trace.stage("send"):
+                await inter.followup.send(embed=embed)
+        
+        except asyncio.TimeoutError:
+            embed = disnake.Embed(
+                title="❌ Превышено время ожидания",
+                description="API не ответило вовремя. Попробуйте позже.",
+                color=0xFF0000
+            )
+            with trace.stage("send"):
+                await inter.followup.send(embed=embed)
+        
         except aiohttp.ClientError as e:
             embed = disnake.Embed(
                 title="❌ Ошибка соединения",
                 description=f"Не удалось подключиться к API: {str(e)}",
                 color=0xFF0000
             )
-            await inter.followup.send(embed=embed)
+            with trace.stage("send"):
+                await inter.followup.send(embed=embed)
         
         except Exception as e:
             embed = disnake.Embed(
@@ -616,8 +4086,684 @@ class RustStats(commands.Cog):
                 description=f"```{str(e)}```",
                 color=0xFF0000
             )
+            with trace.stage("send"):
+                await inter.followup.send(embed=embed)
+        
+        finally:
+            ticket.release()
+            trace.finish(outcome)
+    
+    @account.autocomplete("steam")
+    async def account_autocomplete(self, inter: disnake.ApplicationCommandInteraction, user_input: str) -> dict:
+        """Подсказки из уже полученных профилей, без запросов к API"""
+        return {
+            f"{name[:70]} • {steamid}": steamid
+            for name, steamid in self.players.suggest(user_input)
+        }
+    
+    @check.sub_command(name="bulk", description="Проверить сразу несколько игроков")
+    async def bulk(
+        self,
+        inter: disnake.ApplicationCommandInteraction,
+        players: str = commands.Param(
+            description=f"До {BULK_MAX_PLAYERS} Steam ID или URL через пробел или запятую"
+        )
+    ):
+        # Разные записи одного игрока (ID, ссылка, SteamID2...) проверяются один раз
+        unique = {}
+        for query in re.split(r"[\s,]+", players):
+            if query:
+                unique.setdefault(self.resolve_query(query)[0], query)
+        queries = list(unique.values())
+        if not queries:
+            await inter.response.send_message("❌ Укажите хотя бы один Steam ID или URL.", ephemeral=True)
+            return
+        if len(queries) > BULK_MAX_PLAYERS:
+            await inter.response.send_message(
+                f"❌ За раз можно проверить не больше {BULK_MAX_PLAYERS} игроков.",
+                ephemeral=True
+            )
+            return
+        
+        try:
+            ticket = self.admission.enter(inter.guild_id)
+        except AdmissionRejected as e:
+            await inter.response.send_message(embed=render_busy_embed(e.retry_after), ephemeral=True)
+            return
+        
+        try:
+            await inter.response.defer()
+            await ticket.wait()
+            await self.run_bulk(inter, queries)
+        except AdmissionRejected as e:
+            await inter.edit_original_response(embed=render_busy_embed(e.retry_after))
+        finally:
+            ticket.release()
+    
+    async def run_bulk(self, inter: disnake.ApplicationCommandInteraction, queries: list):
+        results = {query: ("⏳", "Загрузка...") for query in queries}
+        await inter.followup.send(embed=self.build_bulk_embed(queries, results))
+        
+        semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+        
+        async def fetch(query: str):
+            async with semaphore:
+                try:
+                    record, stale = await self.lookup(query, inter.guild_id)
+                except ProfileNotFound:
+                    return query, ("❌", "Профиль не найден")
+                except Exception as e:
+                    return query, ("❌", f"Ошибка: {str(e) or type(e).__name__}")
+            if not record:
+                return query, ("❌", "Данные не найдены")
+            return query, self.bulk_summary(record, stale)
+        
+        for next_result in asyncio.as_completed([fetch(query) for query in queries]):
+            query, result = await next_result
+            results[query] = result
+            await inter.edit_original_response(embed=self.build_bulk_embed(queries, results))
+    
+    def bulk_summary(self, record: ProfileRecord, stale: bool) -> Tuple[str, str]:
+        """Заголовок и текст поля игрока для /check bulk"""
+        flags = []
+        if record.is_banned:
+            flags.append("🔨 Бан")
+        if record.is_private:
+            flags.append("🔒 Приватный")
+        if stale:
+            flags.append("⚠️ Сохранённые данные")
+        
+        lines = [
+            f"⚔️ KDR: **{format_value(record.get('pvp_stats.kdr'))}**",
+            f"💀 У/С: **{format_value(record.get('pvp_stats.kills'))} / {format_value(record.get('pvp_stats.deaths'))}**",
+            f"⏱️ В игре: **{format_value(record.get('overview.time_played'))}**",
+        ]
+        if flags:
+            lines.append(" • ".join(flags))
+        return f"✅ {record.personaname}", "\n".join(lines)
+    
+    def build_bulk_embed(self, queries: list, results: dict) -> disnake.Embed:
+        done = sum(1 for status, _ in results.values() if status != "⏳")
+        embed = disnake.Embed(
+            title="📋 Массовая проверка",
+            description=f"Проверено: **{done}** / {len(queries)}",
+            color=0xCD412B
+        )
+        for query in queries:
+            title, text = results[query]
+            if title in ("⏳", "❌"):
+                title = f"{title} {query}"
+            embed.add_field(name=title[:256], value=text[:1024], inline=True)
+        return embed
+    
+    @check.sub_command(name="compare", description="Сравнить двух игроков по всем категориям")
+    async def compare(
+        self,
+        inter: disnake.ApplicationCommandInteraction,
+        first: str = commands.Param(description="Первый игрок: Steam ID, URL профиля или имя", name="a"),
+        second: str = commands.Param(description="Второй игрок: Steam ID, URL профиля или имя", name="b")
+    ):
+        try:
+            ticket = self.admission.enter(inter.guild_id)
+        except AdmissionRejected as e:
+            await inter.response.send_message(embed=render_busy_embed(e.retry_after), ephemeral=True)
+            return
+        
+        try:
+            await inter.response.defer()
+            await ticket.wait()
+            await self.run_compare(inter, (first.strip(), second.strip()))
+        except AdmissionRejected as e:
+            await inter.edit_original_response(embed=render_busy_embed(e.retry_after))
+        finally:
+            ticket.release()
+    
+    async def run_compare(self, inter: disnake.ApplicationCommandInteraction, queries: tuple):
+        results = await asyncio.gather(
+            *(self.lookup(query, inter.guild_id) for query in queries),
+            return_exceptions=True
+        )
+        for query, result in zip(queries, results):
+            if isinstance(result, ProfileNotFound) or (not isinstance(result, BaseException) and not result[0]):
+                reason = "профиль не найден"
+            elif isinstance(result, BaseException):
+                reason = f"ошибка: {str(result) or type(result).__name__}"
+            else:
+                continue
+            embed = disnake.Embed(
+                title="❌ Не удалось сравнить",
+                description=f"`{query}` — {reason}",
+                color=0xFF0000
+            )
             await inter.followup.send(embed=embed)
+            return
+        
+        (first_record, _), (second_record, _) = results
+        for record in (first_record, second_record):
+            if record.steamid:
+                self.players.hit(record.steamid)
+        view = CompareView(self, first_record, second_record, inter.author.id)
+        await inter.followup.send(embed=await view.get_current_embed(), view=view)
+    
+    @compare.autocomplete("a")
+    async def compare_autocomplete_first(self, inter: disnake.ApplicationCommandInteraction, user_input: str) -> dict:
+        return await self.account_autocomplete(inter, user_input)
+    
+    @compare.autocomplete("b")
+    async def compare_autocomplete_second(self, inter: disnake.ApplicationCommandInteraction, user_input: str) -> dict:
+        return await self.account_autocomplete(inter, user_input)
+    
+    @check.sub_command(name="link", description="Привязать свой Steam ID для таблицы лидеров")
+    @commands.guild_only()
+    async def link(
+        self,
+        inter: disnake.ApplicationCommandInteraction,
+        steam_id: str = commands.Param(
+            description="Steam ID, URL профиля или имя пользователя",
+            name="steam"
+        )
+    ):
+        await inter.response.defer(ephemeral=True)
+        
+        query = steam_id.strip()
+        try:
+            record, _ = await self.lookup(query, inter.guild_id)
+        except ProfileNotFound:
+            await inter.followup.send("❌ Профиль не найден.", ephemeral=True)
+            return
+        except Exception as e:
+            await inter.followup.send(f"❌ Не удалось проверить профиль: {str(e) or type(e).__name__}", ephemeral=True)
+            return
+        if not record or not record.steamid:
+            await inter.followup.send("❌ Не удалось получить статистику для этого профиля.", ephemeral=True)
+            return
+        
+        self.leaderboard.link(inter.guild_id, inter.author.id, record.steamid, record)
+        if self.store is not None:
+            await self.store.set_link(inter.guild_id, inter.author.id, record.steamid)
+        await inter.followup.send(
+            f"✅ Профиль **{record.personaname}** (`{record.steamid}`) привязан.",
+            ephemeral=True
+        )
+    
+    @check.sub_command(name="unlink", description="Отвязать свой Steam ID")
+    @commands.guild_only()
+    async def unlink(self, inter: disnake.ApplicationCommandInteraction):
+        steamid = self.leaderboard.unlink(inter.guild_id, inter.author.id)
+        if steamid is None:
+            await inter.response.send_message("❌ У вас нет привязанного Steam ID.", ephemeral=True)
+            return
+        if self.store is not None:
+            await self.store.set_link(inter.guild_id, inter.author.id, None)
+        await inter.response.send_message(f"✅ Steam ID `{steamid}` отвязан.", ephemeral=True)
+    
+    @check.sub_command(name="top", description="Таблица лидеров сервера")
+    @commands.guild_only()
+    async def top(
+        self,
+        inter: disnake.ApplicationCommandInteraction,
+        metric: str = commands.Param(
+            description="Показатель",
+            choices={title: key for key, (title, _) in LEADERBOARD_METRICS.items()}
+        )
+    ):
+        view = LeaderboardView(self, inter.guild_id, metric, inter.author.id)
+        await inter.response.send_message(embed=view.get_current_embed(), view=view)
+    
+    @check.sub_command_group(name="watch")
+    async def watch(self, inter: disnake.ApplicationCommandInteraction):
+        pass
+    
+    @watch.sub_command(name="add", description="Отслеживать бан и статистику игрока (для администраторов)")
+    @commands.guild_only()
+    @commands.has_permissions(administrator=True)
+    async def watch_add(
+        self,
+        inter: disnake.ApplicationCommandInteraction,
+        steam_id: str = commands.Param(
+            description="Steam ID, URL профиля или имя пользователя",
+            name="steam"
+        )
+    ):
+        if len(self.watchlist.guilds.get(inter.guild_id, ())) >= WATCH_MAX_PER_GUILD:
+            await inter.response.send_message(
+                f"❌ Можно отслеживать не больше {WATCH_MAX_PER_GUILD} игроков.", ephemeral=True
+            )
+            return
+        await inter.response.defer(ephemeral=True)
+        
+        try:
+            record, _ = await self.lookup(steam_id.strip(), inter.guild_id)
+        except ProfileNotFound:
+            await inter.followup.send("❌ Профиль не найден.", ephemeral=True)
+            return
+        except Exception as e:
+            await inter.followup.send(f"❌ Не удалось проверить профиль: {str(e) or type(e).__name__}", ephemeral=True)
+            return
+        if not record or not record.steamid:
+            await inter.followup.send("❌ Не удалось получить статистику для этого профиля.", ephemeral=True)
+            return
+        
+        if not self.watchlist.watch(inter.guild_id, record.steamid, record):
+            await inter.followup.send(f"ℹ️ **{record.personaname}** уже отслеживается.", ephemeral=True)
+            return
+        if self.store is not None:
+            await self.store.set_watch(inter.guild_id, record.steamid, True)
+        
+        note = "" if inter.guild_id in self.watchlist.channels else \
+            "\n⚠️ Канал оповещений не задан — используйте `/check watch channel`."
+        await inter.followup.send(
+            f"✅ **{record.personaname}** (`{record.steamid}`) отслеживается.{note}", ephemeral=True
+        )
+    
+    @watch.sub_command(name="remove", description="Перестать отслеживать игрока (для администраторов)")
+    @commands.guild_only()
+    @commands.has_permissions(administrator=True)
+    async def watch_remove(
+        self,
+        inter: disnake.ApplicationCommandInteraction,
+        steam_id: str = commands.Param(
+            description="Steam ID, URL профиля или имя пользователя",
+            name="steam"
+        )
+    ):
+        steamid, _ = self.resolver.resolve(steam_id)
+        if steamid is None or not self.watchlist.unwatch(inter.guild_id, steamid):
+            await inter.response.send_message("❌ Этот игрок не отслеживается.", ephemeral=True)
+            return
+        if self.store is not None:
+            await self.store.set_watch(inter.guild_id, steamid, False)
+        await inter.response.send_message(f"✅ `{steamid}` больше не отслеживается.", ephemeral=True)
+    
+    @watch.sub_command(name="list", description="Отслеживаемые игроки (для администраторов)")
+    @commands.guild_only()
+    @commands.has_permissions(administrator=True)
+    async def watch_list(self, inter: disnake.ApplicationCommandInteraction):
+        watched = sorted(self.watchlist.guilds.get(inter.guild_id, ()))
+        channel_id = self.watchlist.channels.get(inter.guild_id)
+        embed = disnake.Embed(
+            title="👁️ Отслеживаемые игроки",
+            description=f"Оповещения: {f'<#{channel_id}>' if channel_id else 'канал не задан'}",
+            color=0xCD412B
+        )
+        
+        now = time.monotonic()
+        value = ""
+        for shown, steamid in enumerate(watched):
+            entry = self.profile_cache.peek(steamid)
+            name = entry.record.personaname if entry else steamid
+            state = self.watchlist.state(steamid)
+            line = (
+                f"**{name}** (`{steamid}`) • раз в {state.interval / 60:.0f} мин"
+                f" • опрос через {max(0, int(state.due_at - now)) // 60} мин\n"
+            )
+            if len(value) + len(line) > 3900:
+                value += f"…и ещё {len(watched) - shown}"
+                break
+            value += line
+        embed.description += "\n\n" + (value or "Список пуст. Используйте `/check watch add`.")
+        await inter.response.send_message(embed=embed, ephemeral=True)
+    
+    @watch.sub_command(name="channel", description="Канал для оповещений об изменениях (для администраторов)")
+    @commands.guild_only()
+    @commands.has_permissions(administrator=True)
+    async def watch_channel(
+        self,
+        inter: disnake.ApplicationCommandInteraction,
+        channel: disnake.TextChannel = commands.Param(description="Текстовый канал")
+    ):
+        self.watchlist.channels[inter.guild_id] = channel.id
+        if self.store is not None:
+            await self.store.set_watch_channel(inter.guild_id, channel.id)
+        await inter.response.send_message(f"✅ Оповещения будут приходить в {channel.mention}.", ephemeral=True)
+    
+    @watch_add.autocomplete("steam")
+    async def watch_add_autocomplete(self, inter: disnake.ApplicationCommandInteraction, user_input: str) -> dict:
+        return await self.account_autocomplete(inter, user_input)
+    
+    @check.sub_command(name="export", description="Выгрузить статистику игроков сервера файлом (для администраторов)")
+    @commands.guild_only()
+    @commands.has_permissions(administrator=True)
+    async def export(
+        self,
+        inter: disnake.ApplicationCommandInteraction,
+        fmt: str = commands.Param(
+            name="format",
+            default="csv",
+            description="Формат файла",
+            choices={"CSV": "csv", "Parquet": "parquet"}
+        )
+    ):
+        if fmt == "parquet" and pq is None:
+            await inter.response.send_message("❌ Parquet недоступен: не установлен pyarrow.", ephemeral=True)
+            return
+        members = self.export_members(inter.guild_id)
+        if not members:
+            await inter.response.send_message("📭 На сервере нет привязанных или отслеживаемых игроков.", ephemeral=True)
+            return
+        
+        await inter.response.defer(ephemeral=True)
+        fd, path = tempfile.mkstemp(prefix="ruststats-export-", suffix=f".{fmt}")
+        os.close(fd)
+        try:
+            try:
+                found = await self.write_export(path, fmt, members)
+            except Exception as e:
+                log.exception("Не удалось выгрузить игроков гильдии %s", inter.guild_id)
+                await inter.followup.send(
+                    embed=disnake.Embed(
+                        title="❌ Не удалось выгрузить статистику",
+                        description=f"```{str(e)}```",
+                        color=0xFF0000
+                    ),
+                    ephemeral=True
+                )
+                return
+            size = os.path.getsize(path)
+            if size > inter.guild.filesize_limit:
+                await inter.followup.send(
+                    f"❌ Файл слишком большой для загрузки: {size / 1024 / 1024:.1f} МБ "
+                    f"(лимит сервера {inter.guild.filesize_limit / 1024 / 1024:.0f} МБ)."
+                    + (" Попробуйте Parquet." if fmt == "csv" and pq is not None else ""),
+                    ephemeral=True
+                )
+                return
+            await inter.followup.send(
+                f"📤 Игроков: **{len(members)}**, с сохранённой статистикой: **{found}**",
+                file=disnake.File(path, filename=f"ruststats-{inter.guild_id}.{fmt}"),
+                ephemeral=True
+            )
+        finally:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+    
+    def export_members(self, guild_id: int) -> dict:
+        """steamid → Discord id привязавших участников для привязанных и отслеживаемых игроков гильдии"""
+        members: dict = {}
+        for user_id, steamid in self.leaderboard.links.get(guild_id, {}).items():
+            members.setdefault(steamid, []).append(user_id)
+        for steamid in self.watchlist.guilds.get(guild_id, ()):
+            members.setdefault(steamid, [])
+        return members
+    
+    async def stored_records(self, steamids: list) -> dict:
+        """Профили порции игроков из кэша, остальные — одним запросом к хранилищу
+        
+        В кэш прочитанные с диска профили не кладутся: выгрузка большого
+        сервера или загрузка привязок не должны вытеснять из него то, что
+        сейчас смотрят. Порция — не больше EXPORT_CHUNK_SIZE (лимит
+        переменных SQLite).
+        """
+        records = {}
+        missing = []
+        for steamid in steamids:
+            entry = self.profile_cache.peek(steamid)
+            if entry is not None:
+                records[steamid] = entry.record
+            else:
+                missing.append(steamid)
+        
+        if missing and self.store is not None:
+            for steamid, (body, _) in (await self.store.get_many(missing)).items():
+                try:
+                    record = parse_profile(body)
+                except ValueError:
+                    continue
+                if record:
+                    records[steamid] = record
+        return records
+    
+    async def write_export(self, path: str, fmt: str, members: dict) -> int:
+        """Записать выгрузку порциями по EXPORT_CHUNK_SIZE; возвращает число игроков с профилем
+        
+        Запись файла идёт в потоке, поэтому в памяти одновременно только
+        одна порция, а event loop не блокируется на больших серверах.
+        """
+        loop = asyncio.get_running_loop()
+        writer = await loop.run_in_executor(None, ExportWriter, path, fmt)
+        found = 0
+        try:
+            steamids = list(members)
+            for start in range(0, len(steamids), EXPORT_CHUNK_SIZE):
+                chunk = steamids[start:start + EXPORT_CHUNK_SIZE]
+                records = await self.stored_records(chunk)
+                found += len(records)
+                rows = [export_row(steamid, members[steamid], records.get(steamid)) for steamid in chunk]
+                await loop.run_in_executor(None, writer.write, rows)
+        finally:
+            await loop.run_in_executor(None, writer.close)
+        return found
+    
+    @check.sub_command(name="store", description="Хранилище профилей (для администраторов)")
+    @commands.has_permissions(administrator=True)
+    async def store_info(self, inter: disnake.ApplicationCommandInteraction):
+        if self.store is None:
+            await inter.response.send_message("💾 Хранилище профилей отключено.", ephemeral=True)
+            return
+        
+        stats = await self.store.stats()
+        hit_rate = stats["hits"] / stats["reads"] * 100 if stats["reads"] else 0.0
+        embed = disnake.Embed(title="💾 Хранилище профилей", color=0xCD412B)
+        embed.add_field(name="📁 Файл", value=f"`{self.store.path}`", inline=False)
+        embed.add_field(name="👥 Профилей", value=f"```{stats['rows']}```", inline=True)
+        embed.add_field(name="📈 Снимков истории", value=f"```{stats['snapshots']}```", inline=True)
+        embed.add_field(name="📦 Размер", value=f"```{stats['bytes'] / 1024 / 1024:.1f} МБ```", inline=True)
+        embed.add_field(name="✍️ В очереди на запись", value=f"```{stats['pending']}```", inline=True)
+        embed.add_field(
+            name="🎯 Резервные чтения",
+            value=f"```{stats['hits']} / {stats['reads']} ({hit_rate:.0f}%)```",
+            inline=True
+        )
+        embed.add_field(name="🔥 Загружено при старте", value=f"```{stats['warmed']}```", inline=True)
+        embed.add_field(name="💾 Записано", value=f"```{stats['writes']}```", inline=True)
+        retention = f"{self.store.retention_days:g} дн." if self.store.retention_days else "без ограничения"
+        thinned_at = f"<t:{int(stats['thinned_at'])}:R>" if stats["thinned_at"] else "ещё не было"
+        embed.add_field(
+            name="🧹 Хранение истории",
+            value=f"Все снимки за **{self.store.keep_all_days:g}** дн., дальше один в сутки, "
+                  f"срок хранения: **{retention}**\n"
+                  f"Удалено снимков: **{stats['thinned']}** • Последнее прореживание: {thinned_at}",
+            inline=False
+        )
+        await inter.response.send_message(embed=embed, ephemeral=True)
+    
+    @check.sub_command(name="metrics", description="Задержки команд по стадиям (для администраторов)")
+    @commands.has_permissions(administrator=True)
+    async def metrics_info(self, inter: disnake.ApplicationCommandInteraction):
+        embed = disnake.Embed(
+            title="⏱️ Задержки команд",
+            description="p50 / p95 / p99 в миллисекундах по всем исходам",
+            color=0x00AAFF
+        )
+        
+        for command in self.metrics.commands():
+            outcomes = self.metrics.outcomes(command)
+            rows = [f"{'стадия':<9}{'count':>7}{'p50':>8}{'p95':>8}{'p99':>8}"]
+            for stage, histogram in sorted(self.metrics.stages(command).items()):
+                p50, p95, p99 = (histogram.quantile(q) * 1000 for q in Metrics.QUANTILES)
+                rows.append(f"{stage:<9}{histogram.count:>7}{p50:>8.0f}{p95:>8.0f}{p99:>8.0f}")
+            embed.add_field(
+                name={"account": "/check account", "switch_page": "Переключение страниц"}.get(command, command),
+                value=" • ".join(f"{outcome}: **{count}**" for outcome, count in sorted(outcomes.items())) +
+                      "\n```\n" + "\n".join(rows) + "\n```",
+                inline=False
+            )
+        
+        if not embed.fields:
+            embed.description = "Команды ещё не вызывались."
+        if self.metrics_runner is not None:
+            embed.set_footer(text=f"Prometheus: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        
+        await inter.response.send_message(embed=embed, ephemeral=True)
+    
+    @check.sub_command(name="status", description="Состояние кога (для администраторов)")
+    @commands.has_permissions(administrator=True)
+    async def status(self, inter: disnake.ApplicationCommandInteraction):
+        embed = disnake.Embed(title="⚙️ Состояние RustStats", color=0xCD412B)
+        
+        pool = self.get_pool_stats()
+        if pool["open"]:
+            pool_text = (
+                f"Лимит: **{pool['limit']}** (на хост: **{pool['limit_per_host']}**)\n"
+                f"Занято: **{pool['in_use']}** • Простаивает: **{pool['idle']}**"
+            )
+        else:
+            pool_text = "Сессия закрыта"
+        embed.add_field(name="🌐 Пул соединений", value=pool_text, inline=False)
+        
+        cache = self.profile_cache.stats()
+        embed.add_field(
+            name="🗄️ Кэш профилей",
+            value=f"Записей: **{cache['size']}** / {cache['max_size']}\n"
+                  f"Попаданий: **{cache['hits']}** • Устаревших: **{cache['stale_hits']}**\n"
+                  f"Промахов: **{cache['misses']}** • Вытеснено: **{cache['evictions']}**",
+            inline=False
+        )
+        
+        embeds = self.embed_cache.stats()
+        embed.add_field(
+            name="🖼️ Кэш страниц",
+            value=f"Страниц: **{embeds['size']}** / {embeds['max_size']}\n"
+                  f"Попаданий: **{embeds['hits']}** • Промахов: **{embeds['misses']}**",
+            inline=False
+        )
+        
+        views = self.views.stats()
+        embed.add_field(
+            name="🧩 Активные панели",
+            value=f"Живых: **{views['size']}** / {views['max_size']} • Вытеснено: **{views['evictions']}**",
+            inline=False
+        )
+        
+        limiter = self.limiter.stats()
+        embed.add_field(
+            name="🚦 Лимит запросов к API",
+            value=f"В очереди: **{limiter['depth']}** (гильдий: **{limiter['guilds']}**)\n"
+                  f"Ожидание: в среднем **{limiter['avg_wait']:.2f}** с, максимум **{limiter['max_wait']:.2f}** с\n"
+                  f"Ответов 429: **{limiter['throttled']}**",
+            inline=False
+        )
+        
+        if self.coordinator is not None:
+            coordinator = self.coordinator.stats()
+            embed.add_field(
+                name="🔗 Координатор шардов",
+                value=f"Соединение: **{'🟢 есть' if coordinator['connected'] else '🔴 нет'}** • "
+                      f"Общих токенов: **{self.limiter.shared}**\n"
+                      f"Общий кэш: попаданий **{coordinator['hits']}**, промахов **{coordinator['misses']}**, "
+                      f"отправлено **{coordinator['puts']}** • Сбоев: **{coordinator['failures']}**",
+                inline=False
+            )
+        
+        admission = self.admission.stats()
+        embed.add_field(
+            name="🛂 Допуск команд",
+            value=f"Выполняется: **{admission['active']}** / {admission['global_limit']} "
+                  f"(на гильдию до {admission['guild_limit']})\n"
+                  f"В очереди: **{admission['depth']}** / {admission['queue_size']} • Максимум: **{admission['max_depth']}**\n"
+                  f"Среднее время команды: **{admission['service_time']:.2f}** с • "
+                  f"Отклонено: **{admission['rejected']}** • Истекло в очереди: **{admission['timeouts']}**",
+            inline=False
+        )
+        
+        breaker = self.breaker.stats()
+        breaker_states = {
+            CircuitBreaker.CLOSED: "🟢 замкнут",
+            CircuitBreaker.OPEN: "🔴 разомкнут",
+            CircuitBreaker.HALF_OPEN: "🟡 пробный запрос",
+        }
+        embed.add_field(
+            name="🔌 Circuit breaker",
+            value=f"Состояние: **{breaker_states[breaker['state']]}** • Ошибок подряд: **{breaker['failures']}**\n"
+                  f"Размыканий: **{breaker['trips']}** • Отклонено запросов: **{breaker['rejected']}**",
+            inline=False
+        )
+        
+        resolver = self.resolver.stats()
+        embed.add_field(
+            name="🔎 Кэш vanity-имён",
+            value=f"Имён: **{resolver['size']}** / {resolver['max_size']}\n"
+                  f"Попаданий: **{resolver['hits']}** • Промахов: **{resolver['misses']}**",
+            inline=False
+        )
+        
+        cards = self.cards.stats()
+        embed.add_field(
+            name="🖼️ PNG-карточки",
+            value=(
+                f"Нарисовано: **{cards['renders']}** • Из кэша: **{cards['hits']}** • "
+                f"Ошибок: **{cards['failures']}** • Рисуется: **{cards['rendering']}**"
+                if cards["available"] else "Выключены (нет Pillow или CARD_CACHE_DIR)"
+            ),
+            inline=False
+        )
+        
+        watch = self.watchlist.stats()
+        embed.add_field(
+            name="👁️ Отслеживание",
+            value=f"Игроков: **{watch['players']}** (гильдий: **{watch['guilds']}**) • Просрочено: **{watch['overdue']}**\n"
+                  f"Средний интервал: **{watch['avg_interval'] / 60:.0f}** мин • Опросов: **{watch['polls']}** • "
+                  f"Изменений: **{watch['changes']}** • Оповещений: **{watch['alerts']}**",
+            inline=False
+        )
+        
+        population = self.population.stats()
+        embed.add_field(
+            name="📊 Перцентили",
+            value=f"Профилей: **{population['profiles']}** • Движок: **{population['backend']}** • "
+                  f"Пересборок: **{population['rebuilds']}**",
+            inline=False
+        )
+        
+        players = self.players.stats()
+        embed.add_field(
+            name="⌨️ Автодополнение",
+            value=f"Игроков: **{players['players']}** / {players['max_size']} • Ключей: **{players['keys']}**\n"
+                  f"Запросов подсказок: **{players['queries']}**",
+            inline=False
+        )
+        
+        inflight = self.inflight.stats()
+        embed.add_field(
+            name="🔀 Объединение запросов",
+            value=f"В полёте: **{inflight['in_flight']}** • Запросов к API: **{inflight['calls']}**\n"
+                  f"Сэкономлено запросов: **{inflight['saved']}**",
+            inline=False
+        )
+        
+        await inter.response.send_message(embed=embed, ephemeral=True)
+    
+    async def cog_slash_command_error(self, inter: disnake.ApplicationCommandInteraction, error: Exception) -> bool:
+        """Ответ на нехватку прав; остальные ошибки уходят глобальному обработчику"""
+        if isinstance(error, commands.MissingPermissions):
+            await inter.response.send_message(
+                "❌ Команда доступна только администраторам!",
+                ephemeral=True
+            )
+            return True
+        return False
 
 
 def setup(bot: commands.Bot):
     bot.add_cog(RustStats(bot))
+
+
+def main():
+    """Запуск координатора шардов: python Stats.py [путь к сокету]"""
+    parser = argparse.ArgumentParser(description="Координатор шардов RustStats: общий лимит запросов и кэш профилей")
+    parser.add_argument("socket", nargs="?", default=COORDINATOR_SOCKET or "ruststats.sock", help="путь к Unix-сокету")
+    parser.add_argument("--rate", type=float, default=UPSTREAM_RATE, help="запросов к ruststats.io в секунду на все шарды")
+    parser.add_argument("--burst", type=int, default=UPSTREAM_BURST, help="размер всплеска")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    try:
+        asyncio.run(Coordinator(args.rate, args.burst).serve(args.socket))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Память на профиль в кэше: сырой JSON-словарь против ProfileRecord
+
+Запуск из корня репозитория:
+
+    python benchmarks/bench_memory.py [количество профилей]
+"""
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import Stats  # noqa: E402
+
+FIXTURE = os.path.join(ROOT, "benchmarks", "fixtures", "profile.json")
+
+
+def make_bodies(count: int) -> list:
+    """Тела ответов get_profile с разными steamid и числами"""
+    with open(FIXTURE, encoding="utf-8") as f:
+        payload = json.load(f)
+
+    bodies = []
+    for i in range(count):
+        payload["steamid"] = str(76561198000000000 + i)
+        payload["pvp_stats"]["kills"] = 1000 + i
+        payload["gathered"]["wood"] = 500000 + i * 7
+        bodies.append(json.dumps(payload).encode())
+    return bodies
+
+
+def measure(bodies: list, parse) -> float:
+    """Байт на профиль, удерживаемых после разбора всех тел"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [parse(body) for body in bodies]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return (after - before) / len(bodies)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    bodies = make_bodies(count)
+
+    raw = measure(bodies, json.loads)
+    record = measure(bodies, lambda body: Stats.ProfileRecord.from_payload(Stats.json_loads(body)))
+
+    print(f"{count} profiles, decoder: {'orjson' if Stats.orjson else 'json'}")
+    print(f"raw JSON dict   {raw:10.0f} bytes/profile")
+    print(f"ProfileRecord   {record:10.0f} bytes/profile  x{raw / record:.1f} smaller")
+
+
+if __name__ == "__main__":
+    main()
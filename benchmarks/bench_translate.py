@@ -0,0 +1,73 @@
+"""Микро-бенчмарк translate_time: старый цикл re.sub против одного прохода
+
+Запуск из корня репозитория:
+
+    python benchmarks/bench_translate.py
+"""
+import json
+import os
+import re
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import Stats  # noqa: E402
+
+FIXTURE = os.path.join(ROOT, "benchmarks", "fixtures", "profile.json")
+
+
+def legacy_translate_time(text: str) -> str:
+    """Прежняя реализация: отдельный re.sub на каждое слово словаря"""
+    if not text or not isinstance(text, str):
+        return text
+
+    result = text
+    for eng, rus in Stats.TIME_TRANSLATIONS.items():
+        result = re.sub(rf'\b{eng}\b', rus, result, flags=re.IGNORECASE)
+    return result
+
+
+def leaf_values(data):
+    """Все значения профиля в том виде, в каком их получает format_value"""
+    for value in data.values():
+        if isinstance(value, dict):
+            yield from leaf_values(value)
+        elif value is not None:
+            yield value if isinstance(value, str) else str(value)
+
+
+def main():
+    with open(FIXTURE, encoding="utf-8") as f:
+        payload = json.load(f)
+
+    values = list(leaf_values(payload)) + ["N/A", "12 hours"] * 20
+
+    for value in values:
+        assert legacy_translate_time(value) == Stats.translate_time(value), value
+
+    def run(func):
+        for value in values:
+            func(value)
+
+    def run_cold():
+        Stats._translate_cached.cache_clear()
+        run(Stats.translate_time)
+
+    number = 200
+    results = [
+        ("legacy (re.sub x20)", timeit.timeit(lambda: run(legacy_translate_time), number=number)),
+        ("single pass, cold cache", timeit.timeit(run_cold, number=number)),
+        ("single pass, warm cache", timeit.timeit(lambda: run(Stats.translate_time), number=number)),
+    ]
+
+    baseline = results[0][1]
+    print(f"{len(values)} values per render, {number} renders")
+    for name, seconds in results:
+        per_render = seconds / number * 1e6
+        print(f"{name:<26} {per_render:10.1f} us/render  x{baseline / seconds:6.1f}")
+
+
+if __name__ == "__main__":
+    main()
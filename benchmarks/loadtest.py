@@ -0,0 +1,372 @@
+"""Нагрузочный тест кога без Discord и ruststats.io
+
+Поднимает локальную заглушку get_profile на aiohttp и гоняет RustStats.account
+и StatsView.switch_page через поддельные взаимодействия от N одновременных
+пользователей. В конце печатает запросы в секунду, перцентили задержек,
+задержки по стадиям из метрик кога и пиковую память.
+
+Запуск из корня репозитория:
+
+    python benchmarks/loadtest.py --users 50 --iterations 40 --latency 80 --p429 0.02
+
+Только заглушка (чтобы бот или другой процесс ходил в неё по сети):
+
+    python benchmarks/loadtest.py --serve-only --port 8765
+"""
+import argparse
+import asyncio
+import glob
+import itertools
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from aiohttp import web
+from disnake.ext import commands
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import Stats  # noqa: E402
+
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures")
+STEAMID_BASE = 76561198000000000
+
+
+class StubServer:
+    """Заглушка ruststats.io: POST /api/rpc/get_profile {"id": ...}
+
+    Ответ собирается из записанных фикстур: steamid, ник и несколько чисел
+    подменяются под запрошенного игрока, тела кэшируются. Ошибки 404/429/500
+    и приватные профили подмешиваются с заданными вероятностями.
+    """
+
+    def __init__(self, fixtures: list, latency: float, jitter: float,
+                 p404: float, p429: float, p500: float, p_private: float, seed: int):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.jitter = jitter
+        self.p404 = p404
+        self.p429 = p429
+        self.p500 = p500
+        self.p_private = p_private
+        self.random = random.Random(seed)
+        self.bodies: dict = {}
+        self.statuses: dict = {}
+        self.runner = None
+
+    def body_for(self, steamid: int) -> bytes:
+        body = self.bodies.get(steamid)
+        if body is None:
+            payload = json.loads(json.dumps(self.fixtures[steamid % len(self.fixtures)]))
+            number = steamid - STEAMID_BASE
+            payload["steamid"] = str(steamid)
+            payload["personaname"] = f"Player{number}"
+            payload["profileurl"] = f"https://steamcommunity.com/id/player{number}/"
+            payload["pvp_stats"]["kills"] = 1000 + number * 13 % 9000
+            payload["gathered"]["wood"] = 500000 + number * 7
+            if self.random.random() < self.p_private:
+                payload["is_private"] = True
+                payload["overview"]["time_played"] = None
+                payload["pvp_stats"]["kills"] = None
+            body = self.bodies[steamid] = json.dumps(payload).encode()
+        return body
+
+    def reply(self, status: int, **kwargs) -> web.Response:
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        return web.Response(status=status, **kwargs)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        query = (await request.json()).get("id", "")
+        if self.latency:
+            spread = self.latency * self.jitter
+            await asyncio.sleep(max(0.0, self.random.uniform(self.latency - spread, self.latency + spread)))
+
+        roll = self.random.random()
+        if roll < self.p429:
+            return self.reply(429, headers={"Retry-After": "1"})
+        roll -= self.p429
+        if roll < self.p500:
+            return self.reply(500)
+        roll -= self.p500
+
+        steamid = self.steamid_of(query)
+        if steamid is None or roll < self.p404:
+            return self.reply(404)
+        return self.reply(200, body=self.body_for(steamid), content_type="application/json")
+
+    @staticmethod
+    def steamid_of(query: str):
+        kind, value = Stats.parse_steam_input(query)
+        if kind == "steamid":
+            return int(value)
+        if value.startswith("player") and value[6:].isdigit():
+            return STEAMID_BASE + int(value[6:])
+        return None
+
+    async def start(self, host: str, port: int) -> str:
+        app = web.Application()
+        app.router.add_post("/api/rpc/get_profile", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        return f"http://{host}:{port}/api/rpc/get_profile"
+
+    async def close(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+
+class FakeDiscord:
+    """Задержка ответов Discord и счётчик id сообщений для поддельных взаимодействий"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.ids = itertools.count(1)
+
+    async def call(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+class FakeMessage:
+    def __init__(self, discord: FakeDiscord, channel_id: int, message_id: int = None):
+        self.discord = discord
+        self.id = message_id if message_id is not None else next(discord.ids)
+        self.channel = SimpleNamespace(id=channel_id)
+
+    async def edit(self, **kwargs):
+        await self.discord.call()
+
+
+class FakeResponse:
+    def __init__(self, discord: FakeDiscord):
+        self.discord = discord
+
+    async def defer(self, **kwargs):
+        await self.discord.call()
+
+    async def edit_message(self, *args, **kwargs):
+        await self.discord.call()
+
+    async def send_message(self, *args, **kwargs):
+        await self.discord.call()
+
+
+class FakeFollowup:
+    def __init__(self, discord: FakeDiscord, channel_id: int):
+        self.discord = discord
+        self.channel_id = channel_id
+
+    async def send(self, *args, **kwargs) -> FakeMessage:
+        await self.discord.call()
+        return FakeMessage(self.discord, self.channel_id)
+
+
+class FakeInteraction:
+    """Минимум ApplicationCommandInteraction/MessageInteraction, который использует ког"""
+
+    def __init__(self, discord: FakeDiscord, user_id: int, guild_id: int, message: FakeMessage = None):
+        self.discord = discord
+        self.author = SimpleNamespace(id=user_id)
+        self.guild_id = guild_id
+        self.channel_id = guild_id
+        self.response = FakeResponse(discord)
+        self.followup = FakeFollowup(discord, self.channel_id)
+        self.message = message
+
+    async def edit_original_response(self, *args, **kwargs):
+        await self.discord.call()
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def load_fixtures(path: str) -> list:
+    fixtures = []
+    for name in sorted(glob.glob(os.path.join(path, "*.json"))):
+        with open(name, encoding="utf-8") as f:
+            fixtures.append(json.load(f))
+    if not fixtures:
+        raise SystemExit(f"Нет фикстур в {path}")
+    return fixtures
+
+
+async def make_cog(api_url: str, args):
+    """(ког, временный каталог): заглушка вместо ruststats.io, без сетевых вызовов Discord"""
+    bot = commands.InteractionBot()
+    discord = FakeDiscord(args.discord_latency / 1000)
+    bot.get_partial_messageable = lambda channel_id: SimpleNamespace(
+        get_partial_message=lambda message_id: FakeMessage(discord, channel_id, message_id)
+    )
+
+    cog = Stats.RustStats(bot)
+    work_dir = tempfile.mkdtemp(prefix="ruststats-loadtest-")
+    cog.store = Stats.ProfileStore(os.path.join(work_dir, "ruststats.sqlite3")) if args.store else None
+    cog.cards = Stats.CardRenderer(os.path.join(work_dir, "cards"))
+    cog.api_url = api_url
+    cog.limiter = Stats.UpstreamLimiter(rate=args.rate, burst=args.burst)
+    await cog.cog_load()
+    cog.discord = discord
+    return cog, work_dir
+
+
+async def user(cog: Stats.RustStats, number: int, players: list, weights: list, args, latencies: dict, errors: dict):
+    """Один пользователь: /check account случайного игрока и несколько переключений страниц"""
+    rng = random.Random(args.seed + number)
+    guild_id = 1000 + number % args.guilds
+    pages = [page["key"] for page in Stats.PAGES]
+    if cog.store is not None:
+        pages.append(Stats.DELTA_PAGE["key"])
+
+    for _ in range(args.iterations):
+        query = rng.choices(players, cum_weights=weights)[0]
+        inter = FakeInteraction(cog.discord, number, guild_id)
+        followup_send = inter.followup.send
+        sent = []
+
+        async def send(*a, **kw):
+            message = await followup_send(*a, **kw)
+            sent.append((message, kw.get("view")))
+            return message
+        inter.followup.send = send
+
+        start = time.perf_counter()
+        try:
+            await Stats.RustStats.account.callback(cog, inter, query, card=args.cards)
+        except Exception as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            continue
+        latencies["account"].append(time.perf_counter() - start)
+
+        view_messages = [(message, view) for message, view in sent if view is not None]
+        if not view_messages:
+            continue
+        message, view = view_messages[-1]
+        for page in rng.sample(pages, min(args.pages, len(pages))):
+            click = FakeInteraction(cog.discord, number, guild_id, message=message)
+            start = time.perf_counter()
+            try:
+                await view.switch_page(click, page)
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                continue
+            latencies["switch_page"].append(time.perf_counter() - start)
+
+
+def report(cog: Stats.RustStats, stub: StubServer, latencies: dict, errors: dict, elapsed: float, peak: int):
+    total = sum(len(values) for values in latencies.values())
+    print(f"{total} operations in {elapsed:.2f} s, {total / elapsed:.1f} ops/s")
+    print(f"{'operation':<14}{'count':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, values in latencies.items():
+        p50, p95, p99 = (percentile(values, q) * 1000 for q in (0.5, 0.95, 0.99))
+        print(f"{name:<14}{len(values):>8}{len(values) / elapsed:>9.1f}{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}")
+
+    for command in cog.metrics.commands():
+        outcomes = ", ".join(f"{outcome}={count}" for outcome, count in sorted(cog.metrics.outcomes(command).items()))
+        print(f"\n{command}: {outcomes}")
+        for stage, histogram in sorted(cog.metrics.stages(command).items()):
+            p50, p95, p99 = (histogram.quantile(q) * 1000 for q in Stats.Metrics.QUANTILES)
+            print(f"  {stage:<10}{histogram.count:>8}{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}")
+
+    if stub is not None:
+        print("\nstub responses: " + ", ".join(f"{status}={count}" for status, count in sorted(stub.statuses.items())))
+    inflight = cog.inflight.stats()
+    print(f"upstream calls: {inflight['calls']}, coalesced: {inflight['saved']}, "
+          f"profile cache: {len(cog.profile_cache)}, live views: {len(cog.views)}")
+    if errors:
+        print("harness errors: " + ", ".join(f"{name}={count}" for name, count in sorted(errors.items())))
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        maxrss //= 1024
+    print(f"peak RSS: {maxrss / 1024:.1f} MB" + (f", peak traced: {peak / 1024 / 1024:.1f} MB" if peak else ""))
+
+
+async def run(args):
+    stub = None
+    api_url = args.stub_url
+    if api_url is None:
+        stub = StubServer(
+            load_fixtures(args.fixtures), args.latency / 1000, args.jitter,
+            args.p404, args.p429, args.p500, args.p_private, args.seed,
+        )
+        api_url = await stub.start(args.host, args.port)
+        if args.serve_only:
+            print(f"stub listening on {api_url}")
+            await asyncio.Event().wait()
+
+    cog, work_dir = await make_cog(api_url, args)
+    players = [f"{STEAMID_BASE + i}" if i % 2 else f"player{i}" for i in range(args.players)]
+    weights = list(itertools.accumulate(1 / (rank + 1) ** args.skew for rank in range(args.players)))
+    latencies = {"account": [], "switch_page": []}
+    errors: dict = {}
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        user(cog, number, players, weights, args, latencies, errors)
+        for number in range(args.users)
+    ))
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else 0
+    if args.tracemalloc:
+        tracemalloc.stop()
+
+    report(cog, stub, latencies, errors, elapsed, peak)
+
+    cog.cog_unload()
+    await asyncio.sleep(0.1)
+    if stub is not None:
+        await stub.close()
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50, help="одновременных пользователей")
+    parser.add_argument("--iterations", type=int, default=20, help="/check account на пользователя")
+    parser.add_argument("--pages", type=int, default=3, help="переключений страниц после каждой проверки")
+    parser.add_argument("--players", type=int, default=500, help="разных игроков в выборке")
+    parser.add_argument("--skew", type=float, default=1.0, help="показатель Ципфа популярности игроков")
+    parser.add_argument("--guilds", type=int, default=5, help="гильдий, по которым распределены пользователи")
+    parser.add_argument("--latency", type=float, default=80, help="средняя задержка заглушки, мс")
+    parser.add_argument("--jitter", type=float, default=0.25, help="разброс задержки заглушки, доля")
+    parser.add_argument("--p404", type=float, default=0.02, help="доля ответов 404")
+    parser.add_argument("--p429", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--p500", type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument("--p-private", type=float, default=0.02, help="доля приватных профилей")
+    parser.add_argument("--discord-latency", type=float, default=0, help="задержка вызовов Discord, мс")
+    parser.add_argument("--rate", type=float, default=1000.0, help="лимит запросов к заглушке в секунду")
+    parser.add_argument("--burst", type=int, default=100, help="размер пачки лимитера")
+    parser.add_argument("--cards", action="store_true", help="показывать страницы PNG-карточками (нужен Pillow)")
+    parser.add_argument("--store", action="store_true", help="включить SQLite-хранилище во временном каталоге")
+    parser.add_argument("--tracemalloc", action="store_true", help="мерить пик памяти Python (замедляет)")
+    parser.add_argument("--fixtures", default=FIXTURES, help="каталог с JSON-ответами get_profile")
+    parser.add_argument("--stub-url", default=None, help="использовать внешнюю заглушку вместо встроенной")
+    parser.add_argument("--serve-only", action="store_true", help="только поднять заглушку")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run(parse_args()))
+    except KeyboardInterrupt:
+        pass